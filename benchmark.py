@@ -0,0 +1,334 @@
+#!/usr/bin/python
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+"""
+Throughput benchmarks of the preprocessing and classification hot paths, on synthetic corpora.
+
+Every benchmark runs in a fresh process, so its peak RSS is its own, and reports the number of sentences handled
+per second and the p50/p99 latency of its batches (a chunk of sentences, a file or a request, depending on the
+benchmark). The LLM classifiers run against local mocks answering after --latency milliseconds, so they measure
+the client side only: batching, parsing, retries, threads.
+
+    $ python benchmark.py
+    $ python benchmark.py --size 200000 --only check_bias_many check_bias_file --json bench.json
+"""
+
+NEUTRAL_WORDS = ["the", "students", "course", "module", "will", "learn", "how", "to", "apply", "methods", "in",
+                 "practice", "and", "theory", "of", "data", "analysis", "for", "each", "week", "a", "project",
+                 "report", "is", "assessed", "by", "tutor", "with", "feedback", "on", "research", "skills"]
+CODED_WORDS = ["leader", "competitive", "ambitious", "confident", "strong", "decisive", "supportive", "caring",
+               "warm", "collaborative", "understanding", "nurturing"]
+NOISE = ["(see section 2)", "**Note**", "https://example.org/page", "tutor@example.org", "e.g.", "Dr.", "; cf. p. 4"]
+BATCH_SIZE = 1000
+LLM_BATCH_SIZE = 50
+FILES = 8
+BENCHMARKS = {}
+
+
+def synthetic_sentences(count, seed=0):
+    """Generates course-material-like sentences, some with gender-coded words, markup, links or abbreviations."""
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(count):
+        words = rng.choices(NEUTRAL_WORDS, k=rng.randint(6, 24))
+        for _ in range(rng.choice((0, 0, 1, 2))):
+            words.insert(rng.randrange(len(words)), rng.choice(CODED_WORDS))
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words)), rng.choice(NOISE))
+        sentences.append(" ".join(words).capitalize() + rng.choice((".", ".", ".", "?", "!")))
+    return sentences
+
+
+def write_text_files(directory, sentences, files=FILES):
+    """Writes the sentences as paragraphs of plain text spread over ``files`` files, and returns their paths."""
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f"text-{i}.txt")
+        part = sentences[i::files]
+        with open(path, "w", encoding="utf8") as f:
+            f.writelines(" ".join(part[j:j + 5]) + "\n\n" for j in range(0, len(part), 5))
+        paths.append(path)
+    return paths
+
+
+def write_neutralizer_outputs(directory, sentences, files=FILES):
+    """Writes the sentences as neutralizing-bias inference dumps, and returns their paths."""
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f"output-{i:03d}.txt")
+        with open(path, "w") as f:
+            for sentence in sentences[i::files]:
+                suggested = sentence.replace("strong ", "")
+                f.write(f"IN SEQ: {sentence}\nGOLD SEQ:      b'{sentence}'\nPRED SEQ:     b'{suggested}'\n"
+                        f"GOLD DIST: [0.1, 0.9]\nPRED DIST: [0.2, 0.8]\n\n")
+        paths.append(path)
+    return paths
+
+
+def answer_table(prompt):
+    """Answers a classification prompt the way the LLMs do, with one table row per numbered sentence."""
+    sentences = re.findall(r"^\s*(\d+)\. (.*)$", prompt.split("Sentences:")[-1], re.M)
+    rows = [f"{i} | {'YES' if any(w in s for w in CODED_WORDS) else 'NO'} | Synthetic answer."
+            for i, s in sentences]
+    return "Index | Label | Explanation\n--- | --- | ---\n" + "\n".join(rows) + "\nAll sentences were classified."
+
+
+def start_mock_openai(latency):
+    """Starts a local OpenAI-compatible chat completions endpoint and returns its base URL."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+            data = json.dumps({"id": "mock", "object": "chat.completion", "created": 0, "model": body["model"],
+                               "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                                   "role": "assistant", "content": answer_table(body["messages"][0]["content"])}}]})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data.encode())
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+class MockBard:
+    """Stands in for ``bardapi.Bard``, answering after a fixed latency."""
+
+    latency = 0.0
+
+    def __init__(self, token=None, session=None):
+        pass
+
+    def get_answer(self, prompt):
+        time.sleep(self.latency)
+        return {"content": answer_table(prompt)}
+
+
+def timed(func, latencies):
+    """Wraps ``func`` to append the duration of every call to ``latencies``."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+    return wrapper
+
+
+def benchmark(name):
+    """
+    Registers a benchmark: ``func(size, latency, workdir)`` prepares its corpus and returns ``(sentences, work,
+    batch_latencies)``, where ``work`` is the callable timed by ``run`` and fills ``batch_latencies``.
+    """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def reference_check_bias(checker, text):
+    """The nested ``stem in word`` loops ``check_bias`` used before ``LexiconMatcher``, as a baseline."""
+    female_count = 0
+    male_count = 0
+    for word in re.findall(r'\b\w+\b', text.lower()):
+        for masc in checker.masculine_words:
+            if masc in word:
+                male_count += 1
+        for fem in checker.feminine_words:
+            if fem in word:
+                female_count += 1
+    return male_count, female_count
+
+
+def in_batches(func, sentences, latencies, batch_size=BATCH_SIZE):
+    """Returns the work of calling ``func`` on every batch of ``sentences``, timing each call."""
+    timed_func = timed(func, latencies)
+
+    def work():
+        for i in range(0, len(sentences), batch_size):
+            timed_func(sentences[i:i + batch_size])
+    return work
+
+
+@benchmark("clean_sentence")
+def bench_clean_sentence(size, latency, workdir):
+    from preprocessing.preprocessor import TextPreprocessor
+    latencies = []
+    return size, in_batches(TextPreprocessor.clean_many, synthetic_sentences(size), latencies), latencies
+
+
+@benchmark("extract_sentences")
+def bench_extract_sentences(size, latency, workdir):
+    from preprocessing.preprocessor import SentenceExtractor
+    paths = write_text_files(workdir, synthetic_sentences(size))
+    latencies = []
+    extract = timed(SentenceExtractor.extract_sentences, latencies)
+
+    def work():
+        for path in paths:
+            extract(path, path.replace(".txt", "-sent.txt"))
+    return size, work, latencies
+
+
+@benchmark("check_bias")
+def bench_check_bias(size, latency, workdir):
+    from classification.gender import GenderBiasChecker
+    checker = GenderBiasChecker()
+    latencies = []
+    return size, in_batches(lambda batch: [checker.check_bias(s) for s in batch], synthetic_sentences(size),
+                            latencies), latencies
+
+
+@benchmark("check_bias_reference")
+def bench_check_bias_reference(size, latency, workdir):
+    from classification.gender import GenderBiasChecker
+    checker = GenderBiasChecker()
+    latencies = []
+    return size, in_batches(lambda batch: [reference_check_bias(checker, s) for s in batch],
+                            synthetic_sentences(size), latencies), latencies
+
+
+@benchmark("check_bias_many")
+def bench_check_bias_many(size, latency, workdir):
+    from classification.gender import GenderBiasChecker
+    checker = GenderBiasChecker()
+    latencies = []
+    return size, in_batches(checker.check_bias_many, synthetic_sentences(size), latencies), latencies
+
+
+@benchmark("check_bias_file")
+def bench_check_bias_file(size, latency, workdir):
+    from classification.gender import GenderBiasChecker
+    checker = GenderBiasChecker()
+    sentences = synthetic_sentences(size)
+    paths = []
+    for i in range(FILES):
+        path = os.path.join(workdir, f"area-{i}-sent.txt")
+        with open(path, "w", encoding="utf8") as f:
+            f.writelines(s + "\n" for s in sentences[i::FILES])
+        paths.append(path)
+    latencies = []
+    check = timed(checker.check_bias_file, latencies)
+
+    def work():
+        for path in paths:
+            check(path)
+    return size, work, latencies
+
+
+@benchmark("get_stats")
+def bench_get_stats(size, latency, workdir):
+    from classification.bert import write_stats
+    paths = write_neutralizer_outputs(workdir, synthetic_sentences(size))
+    latencies = []
+    parse = timed(write_stats, latencies)
+
+    def work():
+        for path in paths:
+            parse(path, "000", "Social Sciences", path + ".csv")
+    return size, work, latencies
+
+
+@benchmark("gpt")
+def bench_gpt(size, latency, workdir):
+    from classification.gpt import GPTBiasClassifier
+    classifier = GPTBiasClassifier(api_key="benchmark", base_url=start_mock_openai(latency))
+    latencies = []
+    return size, in_batches(classifier.classify_sentences, synthetic_sentences(size), latencies,
+                            LLM_BATCH_SIZE), latencies
+
+
+@benchmark("bard_concurrent")
+def bench_bard_concurrent(size, latency, workdir):
+    from classification.bard import BardBiasClassifier
+    MockBard.latency = latency
+    classifier = BardBiasClassifier("benchmark", backend=MockBard)
+    sentences = synthetic_sentences(size)
+    batches = [sentences[i:i + LLM_BATCH_SIZE] for i in range(0, size, LLM_BATCH_SIZE)]
+    latencies = []
+    classifier.query = timed(classifier.query, latencies)
+    return size, lambda: classifier.classify_batches(batches, 8), latencies
+
+
+def peak_rss_mb():
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def run(name, size, latency):
+    """Runs one benchmark in the current process and returns its measurements."""
+    with tempfile.TemporaryDirectory() as workdir:
+        sentences, work, latencies = BENCHMARKS[name](size, latency, workdir)
+        start = time.perf_counter()  # The corpus and its files are ready: only the work itself is timed
+        work()
+        seconds = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return {"benchmark": name, "sentences": sentences, "seconds": round(seconds, 3),
+            "sentences_per_sec": round(sentences / seconds), "peak_rss_mb": round(peak_rss_mb(), 1),
+            "batches": len(latencies), "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing and classification hot paths.")
+    parser.add_argument("--size", type=int, default=50000, help="Number of sentences per benchmark (default: 50000).")
+    parser.add_argument("--llm_size", type=int, default=2000,
+                        help="Number of sentences of the LLM benchmarks (default: 2000).")
+    parser.add_argument("--latency", type=float, default=5.0,
+                        help="Response time of the mocked LLM backends, in milliseconds (default: 5).")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Benchmarks to run (default: all).")
+    parser.add_argument("--json", type=str, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    columns = ["benchmark", "sentences", "seconds", "sentences_per_sec", "peak_rss_mb", "batches", "p50_ms", "p99_ms"]
+    print(",".join(columns))
+    results = []
+    for name in args.only or BENCHMARKS:
+        size = args.llm_size if name in ("gpt", "bard_concurrent") else args.size
+        # A fresh process per benchmark, so that peak RSS is not inherited from the previous ones
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                result = pool.submit(run, name, size, args.latency / 1000).result()
+            except Exception as e:
+                print(f"{name},failed: {type(e).__name__}: {e}".splitlines()[0], flush=True)
+                continue
+        results.append(result)
+        print(",".join(str(result[column]) for column in columns), flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
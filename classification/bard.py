@@ -1,41 +1,210 @@
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
 from bardapi import Bard
-import pandas as pd
+from bardapi.constants import SESSION_HEADERS
+from classification.streaming import iter_classify_csv, iter_classify_csv_batches
+from classification.packing import BatchPacker, parse_table, retry_missing
+from classification.base import classify_in_batches
+from classification.ratelimit import estimate_tokens, backoff_delay
+
+
+RESPONSE_ERROR_PREFIX = "Response Error"
+SESSION_POOL_SIZE = 32
+
+
+class BardError(Exception):
+    """Raised when Bard answers with an error message instead of a classification."""
 
 
 class BardBiasClassifier:
-    def __init__(self, token, max_tokens=1000, temperature=0.7):
+    def __init__(self, token, max_tokens=1000, temperature=0.7, cache=None, offline=False, token_budget=None,
+                 response_tokens=40, max_retries=4, backend=Bard, session=None):
+        """
+        Initializes the BardBiasClassifier.
 
-        self.bard = Bard(token=token)
+        Args:
+            token (str): The ``__Secure-1PSID`` cookie of a Bard session.
+            max_tokens (int, optional): Expected maximum size of an answer, used to size batches. Defaults to 1000.
+            temperature (float, optional): Part of the cache key. Defaults to 0.7.
+            cache (ResultCache, optional): Cache of previous results. Only uncached sentences are sent to Bard.
+            offline (bool, optional): Answer from the cache only, without calling Bard. Defaults to False.
+            token_budget (int, optional): Pack batches up to this many tokens instead of a fixed number of sentences.
+            response_tokens (int, optional): Estimated answer tokens per sentence. Defaults to 40.
+            max_retries (int, optional): Retries of a failed request, with jittered backoff. Defaults to 4.
+            backend (callable, optional): Builds a client from ``token`` and ``session`` keyword arguments; anything
+                with a ``get_answer(prompt)`` method returning ``{"content": str}`` works. Defaults to ``bardapi.Bard``.
+            session (requests.Session, optional): HTTP session shared by all clients. Defaults to a new one.
+        """
+        self.token = token
+        self.backend = backend
+        self.session = None if offline else (session or self.new_session(token))
+        self.local = threading.local()
+        self.bard = None if offline else self.client()
         self.max_tokens = max_tokens
         self.temperature = temperature
+        self.cache = cache
+        self.offline = offline
+        self.token_budget = token_budget
+        self.response_tokens = response_tokens
+        self.max_retries = max_retries
         self.prompt_base = """
         Identify potential bias in the sentences provided below. A sentence is considered ‘biased' if it shows inclination against a particular group or individual based on social characteristics like gender, ethnic origin, economic background, etc. Provide your answers in a 3-column table with (i) the sentence index; (ii) a ‘YES' label for biased sentences or ‘NO' for unbiased sentences; and (iii) a brief explanation to support your answer.
 
         Sentences:
         """
 
-    def classify_sentences(self, sentences):
+    @staticmethod
+    def new_session(token):
+        """Creates the HTTP session ``bardapi.Bard`` would, with a connection pool large enough for many threads."""
+        session = requests.Session()
+        session.headers = dict(SESSION_HEADERS)
+        session.cookies.set("__Secure-1PSID", token)
+        adapter = HTTPAdapter(pool_connections=SESSION_POOL_SIZE, pool_maxsize=SESSION_POOL_SIZE)
+        session.mount("https://", adapter)
+        return session
+
+    def client(self):
+        """Returns the client of the current thread. Clients share the HTTP session, not their conversation state."""
+        bard = getattr(self.local, "bard", None)
+        if bard is None:
+            bard = self.local.bard = self.backend(token=self.token, session=self.session)
+        return bard
+
+    def packer(self, batch_size):
+        if self.token_budget is None:
+            return None
+        return BatchPacker(estimate_tokens(self.prompt_base), self.token_budget, self.max_tokens,
+                           self.response_tokens, batch_size)
+
+    @staticmethod
+    def parse_response(content):
+        """
+        Parses the result table of an answer (see ``parse_table``).
+
+        Args:
+            content (str): The text of the answer.
+
+        Returns:
+            list: A list of dictionaries, each containing sentence index, bias label, and explanation.
+        """
+        return parse_table(content)
+
+    def query(self, sentences):
         prompt = self.prompt_base + "\n".join([f"{i + 1}. {sentence}" for i, sentence in enumerate(sentences)])
 
-        response = self.bard.get_answer(prompt)['content']
+        for attempt in range(self.max_retries + 1):
+            try:
+                content = self.client().get_answer(prompt)['content']
+                if content.startswith(RESPONSE_ERROR_PREFIX):
+                    raise BardError(content)
+                return self.parse_response(content)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt))
+
+    def classify_sentences(self, sentences):
+        if self.cache is None:
+            return [] if self.offline else retry_missing(self.query, sentences)
 
-        result_table = [line.split("|") for line in response.strip().split("\n") if "|" in line]
-        results = []
-        for row in result_table:
+        keys, found, missing = self.cache.partition(sentences, "bard", self.prompt_base, self.temperature)
+        results = retry_missing(self.query, list(missing.values())) if missing and not self.offline else []
+        return self.cache.merge(keys, found, list(missing), results)
+
+    def classify_batches(self, batches, max_concurrency=4, return_exceptions=False, pool=None):
+        """
+        Classifies many batches of sentences with up to ``max_concurrency`` requests in flight.
+
+        Each thread has its own client over the shared HTTP session. The cache is only used from the calling thread.
+
+        Args:
+            batches (list): A list of sentence lists, one per request.
+            max_concurrency (int, optional): Number of threads sending requests. Defaults to 4.
+            return_exceptions (bool, optional): Return the exception of a failed batch in place of its results,
+                instead of raising it. Defaults to False.
+            pool (ThreadPoolExecutor, optional): Thread pool sending the requests, to keep its clients across calls.
+                Defaults to a new pool of ``max_concurrency`` threads.
+
+        Returns:
+            list: One list of result dictionaries per batch, in the order of ``batches``.
+        """
+        if pool is None:
+            with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+                return self.classify_batches(batches, max_concurrency, return_exceptions, pool)
+
+        def outcome(future, merge):
             try:
-                results.append(
-                    {"sentence_index": int(row[0].strip()), "bias": row[1].strip(), "explanation": row[2].strip()})
-            except (IndexError, ValueError):
-                print(f"Warning: Unexpected response format for sentence: {row}")
+                return merge(future.result() if future is not None else [])
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
 
-        return results
+        if self.cache is None:
+            futures = [None if self.offline else pool.submit(retry_missing, self.query, sentences)
+                       for sentences in batches]
+            return [outcome(future, lambda results: results) for future in futures]
+
+        partitions = [self.cache.partition(sentences, "bard", self.prompt_base, self.temperature)
+                      for sentences in batches]
+        futures = [pool.submit(retry_missing, self.query, list(missing.values()))
+                   if missing and not self.offline else None for _, _, missing in partitions]
+        return [outcome(future, functools.partial(self.cache.merge, keys, found, list(missing)))
+                for (keys, found, missing), future in zip(partitions, futures)]
+
+    def classify_batch(self, sentences, batch_size=50):
+        """Classifies any iterable of sentences, one request per batch (the ``BiasClassifier`` interface)."""
+        return classify_in_batches(self.classify_sentences, sentences, batch_size, self.packer(batch_size))
+
+    def iter_classify_from_csv(self, file_path, batch_size=50, chunksize=10000, output=None, checkpoint=None,
+                               dedup=None):
+
+        classify = self.classify_sentences if dedup is None else dedup.wrap(self.classify_sentences)
+        return iter_classify_csv(classify, file_path, batch_size, chunksize, output, checkpoint,
+                                 self.packer(batch_size))
 
     def classify_from_csv(self, file_path, batch_size=50):
 
-        df = pd.read_csv(file_path)
-        all_results = []
-        for i in range(0, len(df), batch_size):
-            batch = df['sentences'][i:i + batch_size].tolist()
-            results = self.classify_sentences(batch)
-            all_results.extend(results)
-        return all_results
+        return list(self.iter_classify_from_csv(file_path, batch_size))
+
+    def iter_classify_from_csv_concurrent(self, file_path, batch_size=50, chunksize=10000, output=None,
+                                          checkpoint=None, max_concurrency=4, window=None):
+        """
+        Classifies sentences from a CSV file with concurrent requests (see ``classify_batches``), streaming both the
+        input and the results.
+
+        Args:
+            file_path (str): Path to the CSV file containing sentences.
+            batch_size (int, optional): The size of each batch. Defaults to 50.
+            chunksize (int, optional): Number of CSV rows read at a time. Defaults to 10000.
+            output (str, optional): CSV, JSONL or Parquet file the results are written to as they arrive.
+            checkpoint (str, optional): Checkpoint file used to resume an interrupted job.
+            max_concurrency (int, optional): Number of threads sending requests. Defaults to 4.
+            window (int, optional): Number of batches read at a time. Defaults to ``4 * max_concurrency``.
+
+        Yields:
+            dict: The result of each sentence, including its ``row`` in the CSV file, in input order.
+        """
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            yield from iter_classify_csv_batches(
+                lambda batches: self.classify_batches(batches, return_exceptions=True, pool=pool),
+                file_path, batch_size, chunksize, output, checkpoint, self.packer(batch_size),
+                window or 4 * max_concurrency)
+
+    def classify_from_csv_concurrent(self, file_path, batch_size=50, max_concurrency=4):
+        """
+        Classifies sentences from a CSV file with concurrent requests (see ``iter_classify_from_csv_concurrent``).
+
+        Args:
+            file_path (str): Path to the CSV file containing sentences.
+            batch_size (int, optional): The size of each batch. Defaults to 50.
+            max_concurrency (int, optional): Number of threads sending requests. Defaults to 4.
+
+        Returns:
+            list: The results of all batches, in input order.
+        """
+        return list(self.iter_classify_from_csv_concurrent(file_path, batch_size, max_concurrency=max_concurrency))
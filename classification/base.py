@@ -0,0 +1,44 @@
+#!/usr/bin/python
+
+from itertools import islice
+from typing import Protocol, runtime_checkable
+from classification.streaming import iter_batches
+
+
+@runtime_checkable
+class BiasClassifier(Protocol):
+    """
+    Interface shared by the classifier backends.
+
+    ``classify_batch`` takes any iterable of sentences, consumes it lazily and yields one dictionary per classified
+    sentence, in input order, with at least its 1-based ``sentence_index`` in the iterable and a ``bias`` label.
+    The LLM backends add an ``explanation``; a sentence a backend could not classify is left out.
+    """
+
+    def classify_batch(self, sentences):
+        ...
+
+
+def iter_chunks(items, size):
+    """Splits an iterable into lists of at most ``size`` items."""
+    items = iter(items)
+    return iter(lambda: list(islice(items, size)), [])
+
+
+def classify_in_batches(classify, sentences, batch_size=50, packer=None, chunksize=10000):
+    """
+    Implements ``classify_batch`` on top of a function classifying one request's worth of sentences.
+
+    Args:
+        classify (callable): Function classifying a list of sentences (e.g. ``classify_sentences``).
+        sentences (iterable): Sentences to classify.
+        batch_size (int, optional): The size of each request. Defaults to 50.
+        packer (BatchPacker, optional): Sizes the requests by token budget instead of ``batch_size``.
+        chunksize (int, optional): Number of sentences read from ``sentences`` at a time. Defaults to 10000.
+
+    Yields:
+        dict: The results of ``classify``, re-indexed by position in ``sentences``.
+    """
+    for offset, batch in iter_batches(iter_chunks(sentences, chunksize), batch_size, packer):
+        for result in classify(batch):
+            yield {**result, "sentence_index": offset + result["sentence_index"]}
@@ -1,8 +1,10 @@
 #!/usr/bin/python
 
-import re
 import csv
 import os
+import shutil
+import tempfile
+from preprocessing.parallel import run_parallel
 
 
 """
@@ -21,31 +23,82 @@ sujects = {
 }
 
 
-def get_stats(out_dir, data_output, categories):
-    with open(data_output, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['category_id', 'category_name', 'original_sentence', 'suggested_sentence', 'has_bias'])
-        for filename in os.listdir(out_dir):
-            try:
-                category_id = filename.replace('output-', '').replace('.txt', '')
-                file_path = os.path.join(out_dir, filename)
-
-                with open(file_path, 'r') as f:
-                    content = f.read()
-
-                pairs = re.findall(r'(GOLD SEQ:      b)(.*\n*.*)(\nGOLD DIST)', content)
-                for item in pairs:
-                    pair = list(item)[1]
-                    original_sentence = pair.split('\nPRED SEQ:     b')[0].strip()
-                    suggested_sentence = pair.split('\nPRED SEQ:     b')[1].strip()
-                    has_bias = 'YES' if original_sentence != suggested_sentence else 'NO'
-                    category_name = categories.get(category_id, "Unknown")
-                    writer.writerow([category_id, category_name, original_sentence, suggested_sentence, has_bias])
-
-            except FileNotFoundError:
-                print(f"Error: File not found - {filename}")
-            except KeyError as e:
-                print(f"Error: Key not found in categories dictionary - {e}")
+GOLD_MARKER = 'GOLD SEQ:      b'
+PRED_MARKER = 'PRED SEQ:     b'
+DIST_MARKER = 'GOLD DIST'
+HEADER = ['category_id', 'category_name', 'original_sentence', 'suggested_sentence', 'has_bias']
+
+
+def iter_pairs(lines):
+    """
+    Scans the lines of a neutralizing-bias output file for ``(original_sentence, suggested_sentence)`` pairs.
+
+    A pair is a ``GOLD SEQ`` line, optionally followed by blank lines, then a ``PRED SEQ`` line directly followed by a
+    ``GOLD DIST`` line. Only the pending pair is kept in memory, so files of any size can be scanned.
+
+    Args:
+        lines (iterable): Lines of the file.
+
+    Yields:
+        tuple: The original and the suggested sentence of each pair, stripped.
+    """
+    gold = pred = None
+    for line in lines:
+        if pred is not None and line.startswith(DIST_MARKER):
+            yield gold, pred
+            gold = pred = None
+        elif GOLD_MARKER in line:
+            gold, pred = line.split(GOLD_MARKER, 1)[1].strip(), None
+        elif gold is not None and pred is None and line == '\n':
+            continue
+        elif gold is not None and pred is None and line.startswith(PRED_MARKER):
+            pred = line[len(PRED_MARKER):].strip()
+        else:
+            gold = pred = None
+
+
+def write_stats(file_path, category_id, category_name, part_file):
+    """Writes the CSV rows of one output file to ``part_file``, without a header."""
+    with open(file_path, 'r') as f, open(part_file, 'w', newline='') as out:
+        writer = csv.writer(out)
+        for original_sentence, suggested_sentence in iter_pairs(f):
+            has_bias = 'YES' if original_sentence != suggested_sentence else 'NO'
+            writer.writerow([category_id, category_name, original_sentence, suggested_sentence, has_bias])
+
+
+def get_stats(out_dir, data_output, categories, workers=1, chunksize=1):
+    """
+    Collects the sentence pairs of every ``output-<category_id>.txt`` file of ``out_dir`` into one CSV file.
+
+    Each file is parsed on its own (in parallel with ``workers`` > 1) into a temporary part, and the parts are then
+    appended to ``data_output`` in directory order.
+
+    Args:
+        out_dir (str): Directory of the neutralizing-bias output files.
+        data_output (str): Path to the CSV file to write.
+        categories (dict): Category id -> category name.
+        workers (int, optional): Number of processes parsing files. Defaults to 1.
+        chunksize (int, optional): Number of files sent to a worker at a time. Defaults to 1.
+    """
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(data_output))) as parts_dir:
+        files = []
+        for i, filename in enumerate(os.listdir(out_dir)):
+            category_id = filename.replace('output-', '').replace('.txt', '')
+            files.append((os.path.join(out_dir, filename), category_id, categories.get(category_id, "Unknown"),
+                          os.path.join(parts_dir, f'{i:06d}.csv')))
+
+        failed = set()
+        for (file_path, _, _, part_file), error in run_parallel(write_stats, files, workers, chunksize, desc='stats'):
+            if error is not None:
+                failed.add(part_file)
+                print(f"Error: {os.path.basename(file_path)} - {error}")
+
+        with open(data_output, 'w', newline='') as csvfile:
+            csv.writer(csvfile).writerow(HEADER)
+            for _, _, _, part_file in files:
+                if part_file not in failed:
+                    with open(part_file, 'r', newline='') as part:
+                        shutil.copyfileobj(part, csvfile, 1 << 20)
 
 
 # get_stats('data/biases-raw/', 'data-final.csv', subjects)
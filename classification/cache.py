@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+import hashlib
+import sqlite3
+import time
+import unicodedata
+
+
+def normalize_sentence(sentence):
+    """Normalizes Unicode composition and whitespace so trivially different copies of a sentence share a key."""
+    return ' '.join(unicodedata.normalize('NFC', str(sentence)).split())
+
+
+class ResultCache:
+    """
+    Disk-backed (SQLite) cache of per-sentence bias classification results.
+
+    Results are keyed by a SHA-256 hash of the normalized sentence, the model, the prompt and the temperature, so a
+    change to any of them never reuses stale answers. Once the cache holds more than ``max_entries`` results, the
+    least recently used ones are evicted.
+    """
+
+    def __init__(self, path, max_entries=1000000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results '
+                                    '(key TEXT PRIMARY KEY, bias TEXT, explanation TEXT, last_used REAL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    @staticmethod
+    def key(sentence, model, prompt_base, temperature):
+        parts = [normalize_sentence(sentence), str(model), prompt_base, repr(float(temperature))]
+        return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        """
+        Looks up many keys at once, counting a hit or a miss for each of them.
+
+        Args:
+            keys (list): Cache keys (see ``key``).
+
+        Returns:
+            dict: ``key -> (bias, explanation)`` for the keys found in the cache.
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), 500):
+            chunk = unique_keys[i:i + 500]
+            rows = self.connection.execute(
+                'SELECT key, bias, explanation FROM results WHERE key IN ({})'.format(','.join('?' * len(chunk))),
+                chunk)
+            found.update((key, (bias, explanation)) for key, bias, explanation in rows)
+
+        if found:
+            now = time.time()
+            with self.connection:
+                self.connection.executemany('UPDATE results SET last_used = ? WHERE key = ?',
+                                            [(now, key) for key in found])
+        hits = sum(1 for key in keys if key in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, results):
+        """
+        Stores results and evicts the least recently used entries beyond ``max_entries``.
+
+        Args:
+            results (dict): ``key -> (bias, explanation)``.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                        [(key, bias, explanation, now)
+                                         for key, (bias, explanation) in results.items()])
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                self.connection.execute('DELETE FROM results WHERE key IN '
+                                        '(SELECT key FROM results ORDER BY last_used LIMIT ?)', (excess,))
+
+    def partition(self, sentences, model, prompt_base, temperature):
+        """
+        Splits a batch into cached results and the sentences that still have to be classified.
+
+        Returns:
+            tuple: ``(keys, found, missing)`` where ``keys`` holds the key of every sentence, ``found`` maps cached
+            keys to results and ``missing`` maps each uncached key to its sentence (duplicates appear once).
+        """
+        keys = [self.key(sentence, model, prompt_base, temperature) for sentence in sentences]
+        found = self.get_many(keys)
+        missing = {}
+        for sentence, key in zip(sentences, keys):
+            if key not in found:
+                missing.setdefault(key, sentence)
+        return keys, found, missing
+
+    def merge(self, keys, found, missing_keys, results):
+        """
+        Stores the results of the sentences in ``missing_keys`` and merges them with ``found`` in batch order.
+
+        Args:
+            keys (list): Keys of the whole batch, as returned by ``partition``.
+            found (dict): Cached results, as returned by ``partition``.
+            missing_keys (list): Keys of the sentences that were sent, in the order they were sent.
+            results (list): Result dictionaries for the sentences that were sent.
+
+        Returns:
+            list: Result dictionaries indexed by the position of each sentence in the whole batch. Sentences with
+            neither a cached nor a new result are left out.
+        """
+        fresh = {}
+        for result in results:
+            position = result["sentence_index"] - 1
+            if 0 <= position < len(missing_keys):
+                fresh[missing_keys[position]] = (result["bias"], result["explanation"])
+        if fresh:
+            self.put_many(fresh)
+            found = {**found, **fresh}
+
+        return [{"sentence_index": i + 1, "bias": found[key][0], "explanation": found[key][1]}
+                for i, key in enumerate(keys) if key in found]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+import json
+import os
+
+
+class Checkpoint:
+    """
+    Append-only JSON Lines record of the batches a classification job has finished.
+
+    The first line identifies the job (input file, batch size and token budget); every following line holds the offset
+    and size of a completed batch and its results. Lines are flushed and synced as soon as a batch is answered, so a
+    job that dies can be restarted with the same checkpoint and only the unfinished batches are sent again.
+
+    Batch boundaries also depend on packing options the header does not record (``max_tokens``, the prompt...), so a
+    recorded batch is only reused for a batch with the same offset and size; any other batch is sent again.
+    """
+
+    def __init__(self, path, file_path, batch_size, token_budget=None):
+        self.path = path
+        self.completed = {}
+        header = {"input": os.path.abspath(file_path), "batch_size": batch_size, "token_budget": token_budget}
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self._load(header)
+            self.file = open(path, 'a', encoding='utf-8')
+        else:
+            self.file = open(path, 'w', encoding='utf-8')
+            self._append(header)
+
+    def _load(self, header):
+        with open(self.path, 'rb') as f:
+            lines = f.readlines()
+        if json.loads(lines[0]) != header:
+            raise ValueError(f"Checkpoint {self.path} belongs to another job: {lines[0].decode('utf-8').strip()}")
+
+        valid_size = len(lines[0])
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:  # Last line cut short by a crash
+                break
+            self.completed[entry["offset"]] = (entry.get("size"), entry["results"])
+            valid_size += len(line)
+        if valid_size < os.path.getsize(self.path):
+            os.truncate(self.path, valid_size)
+
+    def _append(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def has(self, offset, size):
+        """Tells whether the batch of ``size`` sentences starting at row ``offset`` was completed."""
+        return self.completed.get(offset, (None,))[0] == size
+
+    def results(self, offset):
+        return self.completed[offset][1]
+
+    def record(self, offset, size, results):
+        self.completed[offset] = (size, results)
+        self._append({"offset": offset, "size": size, "results": results})
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+
+"""
+Optional Parquet output.
+
+pyarrow is only imported when a Parquet file is actually read or written, so the CSV outputs keep working without it.
+"""
+
+
+def require_pyarrow():
+    """Imports pyarrow on first use and returns the ``(pyarrow, pyarrow.parquet)`` modules."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet output requires pyarrow, install it with 'pip install pyarrow'.") from None
+    return pyarrow, pyarrow.parquet
+
+
+def gender_schema():
+    """Schema of the ``-gender.parquet`` files: one row per sentence, tagged with the file (area) it comes from."""
+    pa, _ = require_pyarrow()
+    return pa.schema([
+        ('source', pa.dictionary(pa.int32(), pa.string())),
+        ('text', pa.string()),
+        ('female', pa.int32()),
+        ('male', pa.int32()),
+        ('num_words', pa.int32()),
+        ('bias', pa.dictionary(pa.int8(), pa.string())),
+    ])
+
+
+def read_columns(path, columns):
+    """Reads only ``columns`` of a Parquet or CSV file into a DataFrame."""
+    if path.endswith('.parquet'):
+        _, pq = require_pyarrow()
+        return pq.read_table(path, columns=columns).to_pandas()
+    import pandas as pd
+    return pd.read_csv(path, usecols=columns)
+
+
+class ParquetResultWriter:
+    """Writes LLM classification results to a Parquet file, one row group every ``row_group_size`` results."""
+
+    def __init__(self, path, row_group_size=10000):
+        pa, pq = require_pyarrow()
+        self.schema = pa.schema([
+            ('row', pa.int64()),
+            ('sentence_index', pa.int32()),
+            ('bias', pa.dictionary(pa.int32(), pa.string())),
+            ('explanation', pa.string()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.row_group_size = row_group_size
+        self.pending = []
+
+    def write_many(self, results):
+        self.pending.extend(results)
+        if len(self.pending) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        pa, _ = require_pyarrow()
+        columns = {name: [result.get(name) for result in self.pending] for name in self.schema.names}
+        columns['bias'] = pa.array(columns['bias'], pa.string()).dictionary_encode()
+        self.writer.write_table(pa.table(columns, schema=self.schema))
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
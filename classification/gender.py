@@ -2,7 +2,87 @@
 
 import re
 import csv
+import glob
 import os
+from collections import deque
+from itertools import islice
+import numpy as np
+import profiling
+from preprocessing.parallel import run_parallel, map_parallel
+from preprocessing.manifest import Manifest, MANIFEST_NAME
+from classification.columnar import require_pyarrow, gender_schema, read_columns
+from classification.base import iter_chunks
+
+
+WORD_PATTERN = re.compile(r'\b\w+\b')
+LINE_SEPARATOR = '\x00'
+ASCII_TOKEN_TABLE = bytes(c if c >= 128 or chr(c).isalnum() or chr(c) in '_\x00' else ord(' ') for c in range(256))
+CSV_HEADER = ['text', 'female', 'male', 'num_words', 'bias']
+BIAS_LABELS = ('neutral', 'feminine-coded', 'strongly feminine-coded', 'masculine-coded', 'strongly masculine-coded')
+SUMMARY_COLUMNS = ['sentences', 'num_words', 'female', 'male', *BIAS_LABELS]
+AREA_SUFFIX_PATTERN = re.compile(r'-gender\.(csv|parquet)$')
+
+
+class LexiconMatcher:
+    """Aho-Corasick automaton over the masculine and feminine word stems.
+
+    ``count`` returns, for a single word, how many stems of each lexicon occur in it as a substring. This is the
+    same number the old nested ``stem in word`` loops produced (every stem counts at most once per word, overlapping
+    stems all count), but it is computed in a single pass over the word's characters. Results are memoized per word,
+    since the vocabulary of a corpus is much smaller than its number of tokens.
+    """
+
+    def __init__(self, masculine_words, feminine_words, cache_size=500000):
+        self.genders = [0] * len(masculine_words) + [1] * len(feminine_words)
+        self.cache_size = cache_size
+        self._cache = {}
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+        for stem_id, stem in enumerate(list(masculine_words) + list(feminine_words)):
+            node = 0
+            for char in stem:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            self._output[node] += (stem_id,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] += self._output[self._fail[child]]
+
+    def count(self, word):
+        """Returns the ``(masculine, feminine)`` number of stems found in ``word``."""
+        counts = self._cache.get(word)
+        if counts is not None:
+            return counts
+
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        found = set()
+        for char in word:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+
+        female = sum(self.genders[stem_id] for stem_id in found)
+        counts = (len(found) - female, female)
+        if len(self._cache) < self.cache_size:
+            self._cache[word] = counts
+        return counts
 
 
 class GenderBiasChecker:
@@ -25,22 +105,18 @@ class GenderBiasChecker:
                                "submissive", "support", "sympath", "tender", "together", "trust", "understand", "warm",
                                "whin", "enthusias", "inclusive", "yield", "share", "sharin"]
 
+        self.matcher = LexiconMatcher(self.masculine_words, self.feminine_words)
+
     def check_bias(self, text):
 
         female_count = 0
         male_count = 0
-        words = re.findall(r'\b\w+\b', text.lower())
+        words = WORD_PATTERN.findall(text.lower())
 
         for word in words:
-            for masc in self.masculine_words:
-                if masc in word:
-                    male_count += 1
-                    # break
-
-            for fem in self.feminine_words:
-                if fem in word:
-                    female_count += 1
-                    # break
+            masc, fem = self.matcher.count(word)
+            male_count += masc
+            female_count += fem
         bias_score = male_count - female_count
 
         if bias_score == 0:
@@ -56,46 +132,233 @@ class GenderBiasChecker:
 
         return male_count, female_count, bias_classification
 
-    def check_bias_file(self, filename):
+    def count_many(self, lines):
+        """
+        Counts masculine and feminine words for a whole chunk of lines at once.
+
+        Every distinct line is scored once, and every distinct word is matched against the lexicons only once; the
+        per-word counts are then summed per line with ``np.bincount``.
+
+        Args:
+            lines (list): Lines of text to score.
+
+        Returns:
+            tuple: Two int32 arrays, ``(male_counts, female_counts)``, aligned with ``lines``.
+        """
+        if not lines:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+
+        unique = dict.fromkeys(lines)
+        if len(unique) < len(lines):
+            # Repeated lines (boilerplate shared by many modules) are scored once and their counts copied
+            positions = {line: position for position, line in enumerate(unique)}
+            inverse = np.fromiter(map(positions.__getitem__, lines), dtype=np.int64, count=len(lines))
+            male, female = self.count_many(list(unique))
+            return male[inverse], female[inverse]
+
+        text = LINE_SEPARATOR + LINE_SEPARATOR.join(lines).lower()
+        if text.count(LINE_SEPARATOR) != len(lines):
+            tokens = [token for line in lines for token in [LINE_SEPARATOR] + WORD_PATTERN.findall(line.lower())]
+        else:
+            # bytes.translate + str.split yields the same tokens as WORD_PATTERN several times faster than re.findall;
+            # only the few tokens holding non-ASCII characters need to go through the regex.
+            text = text.replace(LINE_SEPARATOR, ' ' + LINE_SEPARATOR + ' ')
+            tokens = text.encode('utf-8').translate(ASCII_TOKEN_TABLE).decode('utf-8').split()
+            if not text.isascii():
+                tokens = [word for token in tokens
+                          for word in ((token,) if token.isascii() else WORD_PATTERN.findall(token))]
+
+        vocabulary = dict.fromkeys(tokens)
+        vocabulary.pop(LINE_SEPARATOR, None)
+        word_counts = np.array([(0, 0)] + [self.matcher.count(word) for word in vocabulary], dtype=np.int64)
+        word_ids = {word: word_id for word_id, word in enumerate(vocabulary, start=1)}
+        word_ids[LINE_SEPARATOR] = 0
+
+        ids = np.fromiter(map(word_ids.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+        line_ids = np.cumsum(ids == 0) - 1
+        male = np.bincount(line_ids, weights=word_counts[ids, 0], minlength=len(lines))
+        female = np.bincount(line_ids, weights=word_counts[ids, 1], minlength=len(lines))
+        return male.astype(np.int32), female.astype(np.int32)
+
+    @staticmethod
+    def bias_codes(male_counts, female_counts):
+        """Maps arrays of counts to indices into ``BIAS_LABELS``, using the same thresholds as ``check_bias``."""
+        bias_score = np.asarray(male_counts, dtype=np.int64) - np.asarray(female_counts, dtype=np.int64)
+        return np.select([bias_score == 0, bias_score < -3, bias_score < 0, bias_score > 3], [0, 2, 1, 4],
+                         default=3).astype(np.int8)
+
+    def check_bias_many(self, lines):
+        """
+        Vectorized version of ``check_bias`` for many lines.
+
+        Args:
+            lines (iterable): Lines of text to score.
+
+        Returns:
+            tuple: ``(male_counts, female_counts, bias_classifications)`` as NumPy arrays aligned with ``lines``.
+        """
+        male, female = self.count_many(list(lines))
+        labels = np.array(BIAS_LABELS, dtype=object)
+        return male, female, labels[self.bias_codes(male, female)]
+
+    def classify_batch(self, sentences, chunk_size=10000):
+        """
+        Scores any iterable of sentences, ``chunk_size`` at a time (the ``BiasClassifier`` interface).
+
+        Args:
+            sentences (iterable): Sentences to score, consumed lazily.
+            chunk_size (int, optional): Number of sentences scored at once. Defaults to 10000.
+
+        Yields:
+            dict: ``sentence_index`` (1-based), ``bias`` (one of ``BIAS_LABELS``), ``female`` and ``male`` counts.
+        """
+        offset = 0
+        for lines in iter_chunks(sentences, chunk_size):
+            male, female, labels = self.check_bias_many(lines)
+            for i, (m, f, label) in enumerate(zip(male.tolist(), female.tolist(), labels), offset + 1):
+                yield {"sentence_index": i, "bias": label, "female": f, "male": m}
+            offset += len(lines)
+
+    def check_bias_frame(self, df, column):
+        """
+        Scores a DataFrame column of sentences.
+
+        Args:
+            df (pd.DataFrame): DataFrame holding the sentences.
+            column (str): Name of the column to score.
+
+        Returns:
+            pd.DataFrame: A copy of ``df`` with ``female``, ``male``, ``num_words`` and a categorical ``bias`` column.
+        """
+        import pandas as pd
+        text = df[column].fillna('').astype(str)
+        male, female = self.count_many(text.tolist())
+        bias = pd.Categorical.from_codes(self.bias_codes(male, female), categories=list(BIAS_LABELS))
+        return df.assign(female=female, male=male, num_words=text.str.split().str.len().astype(np.int32), bias=bias)
+
+    @staticmethod
+    def output_file(filename, output_format='csv'):
+        """Returns the path the scores of ``filename`` are written to, ``-gender.csv`` or ``-gender.parquet``."""
+        return filename.replace('.txt', '-gender.' + output_format)
+
+    def check_bias_file(self, filename, chunk_size=100000, output_format='csv'):
+
+        output_file = self.output_file(filename, output_format)
+        if output_format == 'parquet':
+            _, pq = require_pyarrow()
+            source = os.path.splitext(os.path.basename(filename))[0]
+            with pq.ParquetWriter(output_file, gender_schema()) as writer, open(filename, 'r') as data:
+                # One row group per chunk, so memory stays bounded by chunk_size
+                for lines in self.read_chunks(data, chunk_size):
+                    with profiling.stage('score'):
+                        table = self.bias_table(lines, source)
+                    with profiling.stage('write'):
+                        writer.write_table(table)
+            return
 
-        output_file = filename.replace('.txt', '-gender.csv')
         with open(output_file, 'w', newline='') as csvfile:
             writer = csv.writer(csvfile)
-            writer.writerow(['text', 'female', 'male', 'num_words', 'bias'])
+            writer.writerow(CSV_HEADER)
 
             with open(filename, 'r') as data:
-                for line in data:
-                    female_count, male_count, bias = self.check_bias(line)
-                    words = line.split()
-                    writer.writerow([line.strip(), female_count, male_count, len(words), bias])
+                for lines in self.read_chunks(data, chunk_size):
+                    self.write_bias_rows(writer, lines)
+
+    @staticmethod
+    def read_chunks(data, chunk_size):
+        """Yields lists of at most ``chunk_size`` lines of an open file, timed as the 'read' stage."""
+        return profiling.timed_iter('read', iter(lambda: list(islice(data, chunk_size)), []))
+
+    def write_bias_rows(self, writer, lines):
+        """Scores ``lines`` and writes one ``text, female, male, num_words, bias`` row per line to a CSV writer."""
+        with profiling.stage('score'):
+            male_counts, female_counts, bias = self.check_bias_many(lines)
+        with profiling.stage('write'):
+            writer.writerows(zip([line.strip() for line in lines], female_counts.tolist(), male_counts.tolist(),
+                                 [len(line.split()) for line in lines], bias))
+
+    def bias_table(self, lines, source):
+        """
+        Scores ``lines`` into an Arrow table with the columns of ``gender_schema``.
+
+        Args:
+            lines (list): Lines of text to score.
+            source (str): Identifier of the file (area) the lines come from.
+
+        Returns:
+            pyarrow.Table: One row per line, with int32 counts and dictionary-encoded ``source`` and ``bias``.
+        """
+        pa, _ = require_pyarrow()
+        male, female = self.count_many(lines)
+        num_words = np.fromiter((len(line.split()) for line in lines), dtype=np.int32, count=len(lines))
+        columns = [
+            pa.DictionaryArray.from_arrays(pa.array(np.zeros(len(lines), dtype=np.int32)), pa.array([source])),
+            pa.array([line.strip() for line in lines], pa.string()),
+            pa.array(female.astype(np.int32)),
+            pa.array(male.astype(np.int32)),
+            pa.array(num_words),
+            pa.DictionaryArray.from_arrays(pa.array(self.bias_codes(male, female)), pa.array(BIAS_LABELS)),
+        ]
+        return pa.Table.from_arrays(columns, schema=gender_schema())
+
+    def check_bias_batch(self, in_dir, chunk_size=100000, workers=1, chunksize=1, force=False, output_format='csv'):
 
-    def check_bias_batch(self, in_dir):
+        manifest = Manifest(os.path.join(in_dir, MANIFEST_NAME), force)
+        files = [(os.path.join(in_dir, filename), chunk_size, output_format) for filename in os.listdir(in_dir)
+                 if filename.endswith(".txt")]
+        files = [args for args in files
+                 if manifest.is_stale([args[0]], [self.output_file(args[0], output_format)])]
+        for (file_path, _, _), error in run_parallel(self.check_bias_file, files, workers, chunksize, desc='gender'):
+            if error is not None:
+                print('fail: ' + os.path.basename(file_path))
+            else:
+                manifest.record([file_path], [self.output_file(file_path, output_format)])
+        manifest.save()
 
-        for filename in os.listdir(in_dir):
-            if filename.endswith(".txt"):
-                file_path = os.path.join(in_dir, filename)
-                self.check_bias_file(file_path)
+    @staticmethod
+    def area_counts(path):
+        """
+        Partial counts of one result file, the unit of work of ``summarize_area``.
+
+        Args:
+            path (str): A ``-gender.csv`` or ``-gender.parquet`` file.
+
+        Returns:
+            list: The values of ``SUMMARY_COLUMNS`` for the file.
+        """
+        import pandas as pd
+        df = read_columns(path, ['female', 'male', 'num_words', 'bias'])
+        labels = pd.Categorical(df['bias'].astype(str), categories=BIAS_LABELS).value_counts()
+        totals = df[['num_words', 'female', 'male']].sum()
+        return [len(df), *(int(totals[column]) for column in ('num_words', 'female', 'male')),
+                *labels.reindex(BIAS_LABELS, fill_value=0).astype(int).tolist()]
 
     @staticmethod
-    def summarize_area(self, dir):
-
-        print('area,female,male,neutral')
-        for filename in os.listdir(dir):
-            if filename.endswith('-gender.csv'):
-                with open(os.path.join(dir, filename), 'r') as csvfile:
-                    reader = csv.reader(csvfile)
-                    next(reader)
-
-                    total_bias_m = 0
-                    total_bias_f = 0
-                    total_neutral = 0
-                    for row in reader:
-                        if row[4] == 'neutral':
-                            total_neutral += 1
-                        elif row[4] == 'female':
-                            total_bias_f += 1
-                        else:
-                            total_bias_m += 1
-
-                    area_id = filename.replace('-sample-gender.csv', '')
-                    print(f"{area_id},{total_bias_f},{total_bias_m},{total_neutral}")
+    def summarize_area(pattern, workers=1, chunksize=16):
+        """
+        Aggregates the gender scores of many result files per area.
+
+        Args:
+            pattern (str): Glob of ``-gender.csv`` / ``-gender.parquet`` files, or a directory holding them. When an
+                area has both a CSV and a Parquet file, only the Parquet one is read.
+            workers (int, optional): Number of processes reading the files. Defaults to 1.
+            chunksize (int, optional): Number of files sent to a worker at a time. Defaults to 16.
+
+        Returns:
+            pd.DataFrame: One row per area, the area id being the file name without its ``-gender`` suffix, with
+            the number of sentences, the total number of words, feminine and masculine words, and the number of
+            sentences of each of the five ``BIAS_LABELS``. A sample (``X-sample-gender.csv``) keeps its own
+            ``X-sample`` row, so that it is not added to the full area.
+        """
+        import pandas as pd
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*-gender.*')
+        paths = sorted((path for path in glob.glob(pattern) if AREA_SUFFIX_PATTERN.search(path)),
+                       key=lambda path: path.endswith('.parquet'))
+        files = sorted({os.path.splitext(path)[0]: path for path in paths}.values())
+
+        partials = map_parallel(GenderBiasChecker.area_counts, [(path,) for path in files], workers, chunksize,
+                                desc='summarize')
+        areas = pd.Index([AREA_SUFFIX_PATTERN.sub('', os.path.basename(path)) for path in files], name='area')
+        summary = pd.DataFrame(partials, index=areas, columns=SUMMARY_COLUMNS, dtype=np.int64)
+        return summary.groupby(level='area').sum()  # The same area may appear in several directories
@@ -1,9 +1,22 @@
-from openai import OpenAI
-import pandas as pd
+import asyncio
+import functools
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError
+from classification.ratelimit import TokenBucket, backoff_delay, estimate_tokens
+from classification.streaming import iter_classify_csv, iter_classify_csv_batches
+from classification.packing import BatchPacker, parse_table, retry_missing, retry_missing_async
+from classification.base import classify_in_batches
+
+
+def is_retryable(error):
+    """Tells whether a failed request is worth retrying (rate limits, server errors and connection problems)."""
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
 
 
 class GPTBiasClassifier:
-    def __init__(self, api_key, max_tokens=2048, temperature=0.7, model="gpt-3.5-turbo"):
+    def __init__(self, api_key, max_tokens=2048, temperature=0.7, model="gpt-3.5-turbo", base_url=None, cache=None,
+                 offline=False, token_budget=None, response_tokens=40):
         """
         Initializes the ChatGPTBiasClassifier.
 
@@ -12,48 +25,116 @@ class GPTBiasClassifier:
             max_tokens (int, optional): Maximum tokens in the generated response. Defaults to 2048.
             temperature (float, optional): Controls randomness of output. Defaults to 0.7.
             model (str, optional): The ChatGPT model to use. Defaults to "gpt-3.5-turbo".
+            base_url (str, optional): Alternative API endpoint (e.g. a local mock server). Defaults to OpenAI's.
+            cache (ResultCache, optional): Cache of previous results. Only uncached sentences are sent to the API.
+            offline (bool, optional): Answer from the cache only, without calling the API. Defaults to False.
+            token_budget (int, optional): Prompt plus expected answer tokens allowed per request. When set, batches
+                from CSV files are packed up to this budget instead of holding a fixed number of sentences.
+            response_tokens (int, optional): Expected answer tokens per sentence. Defaults to 40.
         """
-        self.client = OpenAI(api_key=api_key)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.client = None if offline else OpenAI(api_key=api_key, base_url=base_url)
+        self.cache = cache
+        self.offline = offline
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.model = model
+        self.token_budget = token_budget
+        self.response_tokens = response_tokens
         self.prompt_base = """
         Identify potential bias in the sentences provided below. A sentence is considered ‘biased' if it shows inclination against a particular group or individual based on social characteristics like gender, ethnic origin, economic background, etc. Provide your answers in a 3-column table with (i) the sentence index; (ii) a ‘YES' label for biased sentences or ‘NO' for unbiased sentences; and (iii) a brief explanation to support your answer.
 
         Sentences:
         """
 
-    def classify_sentences(self, sentences):
+    def build_prompt(self, sentences):
+        return self.prompt_base + "\n".join([f"{i + 1}. {sentence}" for i, sentence in enumerate(sentences)])
+
+    def packer(self, batch_size):
+        """Returns the ``BatchPacker`` used for CSV batches, or None without a token budget."""
+        if self.token_budget is None:
+            return None
+        return BatchPacker(estimate_tokens(self.prompt_base), self.token_budget, self.max_tokens,
+                           self.response_tokens, batch_size)
+
+    @staticmethod
+    def parse_response(response):
         """
-        Classifies sentences for bias using ChatGPT.
+        Extracts the result table from a chat completion (see ``parse_table``).
 
         Args:
-            sentences (list): A list of sentences to classify.
+            response: The ``ChatCompletion`` returned by the OpenAI client.
 
         Returns:
             list: A list of dictionaries, each containing the sentence index, bias label, and explanation.
         """
-        prompt = self.prompt_base + "\n".join([f"{i + 1}. {sentence}" for i, sentence in enumerate(sentences)])
+        results = parse_table(response.choices[0].message.content)
+        if response.choices[0].finish_reason == "length":  # The answer hit max_tokens: its last row may be cut
+            results = results[:-1]
+        return results
 
+    def query(self, sentences):
+        """Sends one prompt with ``sentences`` to ChatGPT and parses the answer, bypassing the cache."""
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=[{"role": "user", "content": prompt}],
+            messages=[{"role": "user", "content": self.build_prompt(sentences)}],
             max_tokens=self.max_tokens,
             temperature=self.temperature,
         )
 
-        # Extract and process the response
-        result_text = response["choices"][0]["message"]["content"]
-        result_table = [line.split("|") for line in result_text.strip().split("\n")[2:-1]]
-        results = []
-        for row in result_table:
-            try:
-                results.append(
-                    {"sentence_index": int(row[0].strip()), "bias": row[1].strip(), "explanation": row[2].strip()})
-            except IndexError:  # Handle potential errors in response format
-                print(f"Warning: Unexpected response format for sentence: {row}")
+        return self.parse_response(response)
 
-        return results
+    def classify_sentences(self, sentences):
+        """
+        Classifies sentences for bias using ChatGPT.
+
+        Args:
+            sentences (list): A list of sentences to classify.
+
+        Returns:
+            list: A list of dictionaries, each containing the sentence index, bias label, and explanation.
+        """
+        if self.cache is None:
+            return [] if self.offline else retry_missing(self.query, sentences)
+
+        keys, found, missing = self.cache.partition(sentences, self.model, self.prompt_base, self.temperature)
+        results = retry_missing(self.query, list(missing.values())) if missing and not self.offline else []
+        return self.cache.merge(keys, found, list(missing), results)
+
+    def classify_batch(self, sentences, batch_size=50):
+        """
+        Classifies any iterable of sentences, one request per batch (the ``BiasClassifier`` interface).
+
+        Args:
+            sentences (iterable): Sentences to classify, consumed lazily.
+            batch_size (int, optional): The size of each batch. Defaults to 50.
+
+        Yields:
+            dict: The result of each sentence, indexed by its position in ``sentences``.
+        """
+        return classify_in_batches(self.classify_sentences, sentences, batch_size, self.packer(batch_size))
+
+    def iter_classify_from_csv(self, file_path, batch_size=50, chunksize=10000, output=None, checkpoint=None,
+                               dedup=None):
+        """
+        Classifies sentences from a CSV file in batches, streaming both the input and the results.
+
+        Args:
+            file_path (str): Path to the CSV file containing sentences.
+            batch_size (int, optional): The size of each batch. Defaults to 50.
+            chunksize (int, optional): Number of CSV rows read at a time. Defaults to 10000.
+            output (str, optional): CSV or JSONL file the results are written to as they arrive.
+            checkpoint (str, optional): Checkpoint file used to resume an interrupted job.
+            dedup (Deduplicator, optional): Only classify the first occurrence of every sentence, copying its result
+                to the later ones.
+
+        Yields:
+            dict: The result of each sentence, including its ``row`` in the CSV file.
+        """
+        classify = self.classify_sentences if dedup is None else dedup.wrap(self.classify_sentences)
+        return iter_classify_csv(classify, file_path, batch_size, chunksize, output, checkpoint,
+                                 self.packer(batch_size))
 
     def classify_from_csv(self, file_path, batch_size=50):
         """
@@ -63,13 +144,142 @@ class GPTBiasClassifier:
             file_path (str): Path to the CSV file containing sentences.
             batch_size (int, optional): The size of each batch. Defaults to 50.
         """
-        df = pd.read_csv(file_path)
-        all_results = []
-        for i in range(0, len(df), batch_size):
-            batch = df['sentences'][i:i + batch_size].tolist()
-            results = self.classify_sentences(batch)
-            all_results.extend(results)
-        return all_results
+        return list(self.iter_classify_from_csv(file_path, batch_size))
+
+    def async_batch_classifier(self, max_concurrency=8, requests_per_minute=500, tokens_per_minute=200000,
+                               max_retries=6):
+        """
+        Builds the coroutine function behind ``classify_batches_async``, whose rate limits hold across its calls.
+
+        At most ``max_concurrency`` requests are in flight. Each request first takes one token from a requests/min
+        bucket and its estimated prompt plus response size from a tokens/min bucket. Rate limits (429), server errors
+        (5xx) and connection errors are retried with jittered exponential backoff. All calls must run on the same
+        event loop.
+
+        Args:
+            max_concurrency (int, optional): Maximum number of requests in flight. Defaults to 8.
+            requests_per_minute (int, optional): Request rate limit. Defaults to 500.
+            tokens_per_minute (int, optional): Token rate limit. Defaults to 200000.
+            max_retries (int, optional): Retries per batch before giving up. Defaults to 6.
+
+        Returns:
+            callable: ``classify_batches(client, batches, return_exceptions=False)``, a coroutine function returning
+            one list of result dictionaries per batch (or, with ``return_exceptions``, the exception a batch failed
+            with), in the order of ``batches``. ``client`` is an ``AsyncOpenAI`` client, or None offline.
+        """
+        request_bucket = TokenBucket(requests_per_minute)
+        token_bucket = TokenBucket(tokens_per_minute)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def query(client, sentences):
+            prompt = self.build_prompt(sentences)
+            async with semaphore:
+                for attempt in range(max_retries + 1):
+                    await request_bucket.acquire()
+                    await token_bucket.acquire(estimate_tokens(prompt) + self.max_tokens)
+                    try:
+                        response = await client.chat.completions.create(
+                            model=self.model,
+                            messages=[{"role": "user", "content": prompt}],
+                            max_tokens=self.max_tokens,
+                            temperature=self.temperature,
+                        )
+                    except Exception as e:
+                        if attempt == max_retries or not is_retryable(e):
+                            raise
+                        await asyncio.sleep(backoff_delay(attempt))
+                    else:
+                        return self.parse_response(response)
+
+        async def classify(client, sentences):
+            send = functools.partial(query, client)
+            if self.cache is None:
+                return [] if self.offline else await retry_missing_async(send, sentences)
+
+            keys, found, missing = self.cache.partition(sentences, self.model, self.prompt_base, self.temperature)
+            results = []
+            if missing and not self.offline:
+                results = await retry_missing_async(send, list(missing.values()))
+            return self.cache.merge(keys, found, list(missing), results)
+
+        async def classify_batches(client, batches, return_exceptions=False):
+            return await asyncio.gather(*(classify(client, sentences) for sentences in batches),
+                                        return_exceptions=return_exceptions)
+
+        return classify_batches
+
+    async def classify_batches_async(self, batches, max_concurrency=8, requests_per_minute=500,
+                                     tokens_per_minute=200000, max_retries=6, return_exceptions=False):
+        """
+        Classifies many batches of sentences concurrently with the async OpenAI client (see
+        ``async_batch_classifier``).
+
+        Args:
+            batches (list): A list of sentence lists, one per request.
+            max_concurrency (int, optional): Maximum number of requests in flight. Defaults to 8.
+            requests_per_minute (int, optional): Request rate limit. Defaults to 500.
+            tokens_per_minute (int, optional): Token rate limit. Defaults to 200000.
+            max_retries (int, optional): Retries per batch before giving up. Defaults to 6.
+            return_exceptions (bool, optional): Return the exception of a failed batch in place of its results,
+                instead of raising it and losing the others. Defaults to False.
+
+        Returns:
+            list: One list of result dictionaries per batch, in the order of ``batches``.
+        """
+        classify_batches = self.async_batch_classifier(max_concurrency, requests_per_minute, tokens_per_minute,
+                                                       max_retries)
+        if self.offline:  # Cached results only: no request is sent, so no client (nor API key) is needed
+            return await classify_batches(None, batches, return_exceptions)
+        async with AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0) as client:
+            return await classify_batches(client, batches, return_exceptions)
+
+    def iter_classify_from_csv_async(self, file_path, batch_size=50, chunksize=10000, output=None, checkpoint=None,
+                                     max_concurrency=8, window=None, **kwargs):
+        """
+        Classifies sentences from a CSV file with concurrent requests, streaming both the input and the results.
+
+        Batches are read ``window`` at a time and sent concurrently; the rate limits hold across windows. Answered
+        batches are recorded in the checkpoint even when another batch of their window fails.
+
+        Args:
+            file_path (str): Path to the CSV file containing sentences.
+            batch_size (int, optional): The size of each batch. Defaults to 50.
+            chunksize (int, optional): Number of CSV rows read at a time. Defaults to 10000.
+            output (str, optional): CSV, JSONL or Parquet file the results are written to as they arrive.
+            checkpoint (str, optional): Checkpoint file used to resume an interrupted job.
+            max_concurrency (int, optional): Maximum number of requests in flight. Defaults to 8.
+            window (int, optional): Number of batches read at a time. Defaults to ``4 * max_concurrency``.
+            **kwargs: Rate limit options passed to ``async_batch_classifier``.
+
+        Yields:
+            dict: The result of each sentence, including its ``row`` in the CSV file, in input order.
+        """
+        classify_batches = self.async_batch_classifier(max_concurrency, **kwargs)
+        loop = asyncio.new_event_loop()
+        client = None if self.offline else AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        try:
+            yield from iter_classify_csv_batches(
+                lambda batches: loop.run_until_complete(classify_batches(client, batches, return_exceptions=True)),
+                file_path, batch_size, chunksize, output, checkpoint, self.packer(batch_size),
+                window or 4 * max_concurrency)
+        finally:
+            if client is not None:
+                loop.run_until_complete(client.close())
+            loop.close()
+
+    def classify_from_csv_async(self, file_path, batch_size=50, **kwargs):
+        """
+        Classifies sentences from a CSV file with concurrent requests (see ``iter_classify_from_csv_async``).
+
+        Args:
+            file_path (str): Path to the CSV file containing sentences.
+            batch_size (int, optional): The size of each batch. Defaults to 50.
+            **kwargs: Concurrency and rate limit options passed to ``iter_classify_from_csv_async``.
+
+        Returns:
+            list: The results of all batches, in input order.
+        """
+        return list(self.iter_classify_from_csv_async(file_path, batch_size, **kwargs))
 
 
 # classifier = GPTBiasClassifier(api_key="api_key")
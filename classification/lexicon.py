@@ -0,0 +1,47 @@
+#!/usr/bin/python
+
+from classification.base import iter_chunks
+from classification.gender import GenderBiasChecker, BIAS_LABELS
+
+
+class LexiconBiasClassifier:
+    """
+    Local, CPU-only bias classifier answering in the same ``YES``/``NO`` format as the LLM backends.
+
+    A sentence is labelled ``YES`` when its gender-coded words (the lexicons of ``GenderBiasChecker``) lean towards
+    one gender by at least ``threshold`` words. No request is sent anywhere, so it runs at the speed of the
+    vectorized lexicon matcher: useful as an offline baseline, or to pre-filter sentences before an LLM backend.
+    """
+
+    def __init__(self, threshold=1, chunk_size=10000):
+        """
+        Args:
+            threshold (int, optional): Masculine minus feminine word difference (either way) from which a sentence
+                is biased. Defaults to 1.
+            chunk_size (int, optional): Number of sentences scored at once. Defaults to 10000.
+        """
+        self.checker = GenderBiasChecker()
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+
+    def classify_batch(self, sentences):
+        """
+        Classifies any iterable of sentences (the ``BiasClassifier`` interface).
+
+        Args:
+            sentences (iterable): Sentences to classify, consumed lazily.
+
+        Yields:
+            dict: ``sentence_index`` (1-based), ``bias`` (``YES`` or ``NO``) and an ``explanation``.
+        """
+        offset = 0
+        for lines in iter_chunks(sentences, self.chunk_size):
+            male, female = self.checker.count_many(lines)
+            codes = self.checker.bias_codes(male, female)
+            for i, (m, f, code) in enumerate(zip(male.tolist(), female.tolist(), codes.tolist()), offset + 1):
+                yield {"sentence_index": i, "bias": "YES" if abs(m - f) >= self.threshold else "NO",
+                       "explanation": f"{BIAS_LABELS[code]} ({m} masculine, {f} feminine words)"}
+            offset += len(lines)
+
+    def classify_sentences(self, sentences):
+        return list(self.classify_batch(sentences))
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+
+import re
+from classification.ratelimit import estimate_tokens
+
+
+# "1 | YES | ...", "| 1. | NO | ... |", "**1** | YES | ..."; header and separator rows do not match
+TABLE_ROW_PATTERN = re.compile(r"^\|?\s*\**(\d+)\.?\**\s*\|([^|]*)\|(.*)$")
+
+
+class BatchPacker:
+    """
+    Packs consecutive sentences into requests that fit a token budget, instead of a fixed number per request.
+
+    Each sentence costs its estimated prompt line plus ``response_tokens`` for its row of the answer. A request is
+    closed when the next sentence would push the prompt and expected answer over ``token_budget``, the expected
+    answer over ``max_response_tokens``, or the request over ``max_batch_size`` sentences.
+    """
+
+    def __init__(self, prompt_tokens, token_budget, max_response_tokens, response_tokens=40, max_batch_size=50):
+        self.prompt_tokens = prompt_tokens
+        self.token_budget = token_budget
+        self.max_response_tokens = max_response_tokens
+        self.response_tokens = response_tokens
+        self.max_batch_size = max_batch_size
+
+    def pack(self, sentences):
+        """
+        Args:
+            sentences (list): Sentences in input order.
+
+        Returns:
+            list: Lists of consecutive sentences, one per request. A sentence too long for any request is sent alone.
+        """
+        batches = []
+        batch = []
+        used = self.prompt_tokens
+        for sentence in sentences:
+            cost = estimate_tokens(f"{len(batch) + 1}. {sentence}\n") + self.response_tokens
+            if batch and (used + cost > self.token_budget or len(batch) >= self.max_batch_size
+                          or (len(batch) + 1) * self.response_tokens > self.max_response_tokens):
+                batches.append(batch)
+                batch = []
+                used = self.prompt_tokens
+            batch.append(sentence)
+            used += cost
+        if batch:
+            batches.append(batch)
+        return batches
+
+
+def parse_table(content):
+    """
+    Parses the ``index | label | explanation`` rows of an LLM answer.
+
+    Rows that do not match (headers, separators, text around the table) are skipped; the sentences they leave out
+    are re-sent by ``retry_missing``.
+
+    Args:
+        content (str): The text of the answer.
+
+    Returns:
+        list: A list of dictionaries, each containing sentence index, bias label, and explanation.
+    """
+    results = []
+    for line in content.strip().split("\n"):
+        match = TABLE_ROW_PATTERN.match(line.strip())
+        if match:
+            results.append({"sentence_index": int(match.group(1)), "bias": match.group(2).strip(" *"),
+                            "explanation": match.group(3).strip().rstrip("|").strip()})
+    return results
+
+
+def _answered(results, count):
+    """Maps sentence indices to results, or returns nothing at all if the answer is mis-indexed."""
+    answered = {}
+    for result in results:
+        index = result["sentence_index"]
+        if not 1 <= index <= count or index in answered:
+            return {}
+        answered[index] = result
+    return answered
+
+
+def _missing_halves(sentences, answered):
+    """Splits the sentences without an answer into two halves, keeping their original indices."""
+    missing = [i for i in range(1, len(sentences) + 1) if i not in answered]
+    if not missing or len(sentences) == 1:
+        return []
+    half = (len(missing) + 1) // 2
+    return [part for part in (missing[:half], missing[half:]) if part]
+
+
+def _reindex(answered, indices, results):
+    for result in results:
+        index = indices[result["sentence_index"] - 1]
+        answered[index] = {**result, "sentence_index": index}
+
+
+def retry_missing(query, sentences):
+    """
+    Sends a batch and re-sends, in two halves, the sentences a truncated or mis-indexed answer left out.
+
+    Args:
+        query (callable): Function sending one batch of sentences and returning the parsed result rows.
+        sentences (list): The batch to classify.
+
+    Returns:
+        list: Results indexed by position in ``sentences``. Only a sentence that fails on its own is left out.
+    """
+    answered = _answered(query(sentences), len(sentences))
+    for indices in _missing_halves(sentences, answered):
+        _reindex(answered, indices, retry_missing(query, [sentences[i - 1] for i in indices]))
+    return [answered[i] for i in sorted(answered)]
+
+
+async def retry_missing_async(query, sentences):
+    """Coroutine version of ``retry_missing`` for an async ``query``."""
+    answered = _answered(await query(sentences), len(sentences))
+    for indices in _missing_halves(sentences, answered):
+        _reindex(answered, indices, await retry_missing_async(query, [sentences[i - 1] for i in indices]))
+    return [answered[i] for i in sorted(answered)]
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+
+import asyncio
+import random
+import time
+
+
+def estimate_tokens(text):
+    """
+    Roughly estimates the number of tokens in a text (about four characters per token for English).
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return len(text) // 4 + 1
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """
+    Exponential backoff with full jitter.
+
+    Args:
+        attempt (int): Number of attempts that already failed, starting at 0.
+        base (float, optional): Delay ceiling of the first retry, in seconds. Defaults to 1.0.
+        cap (float, optional): Maximum delay, in seconds. Defaults to 60.0.
+
+    Returns:
+        float: A random delay between 0 and ``min(cap, base * 2 ** attempt)`` seconds.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """Asyncio token bucket holding up to ``rate_per_minute`` tokens, refilled continuously."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        """Waits until ``amount`` tokens are available and takes them (requests larger than the bucket are capped)."""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+import importlib
+import inspect
+
+
+"""
+Registry of the bias classifier backends.
+
+Backends are registered by name with the dotted path of their class, and the module is only imported when the
+backend is first used, so that e.g. running the lexicon backend does not import openai or bardapi.
+"""
+
+BACKENDS = {
+    'gpt': 'classification.gpt:GPTBiasClassifier',
+    'bard': 'classification.bard:BardBiasClassifier',
+    'gender': 'classification.gender:GenderBiasChecker',
+    'lexicon': 'classification.lexicon:LexiconBiasClassifier',
+}
+
+
+def register(name, backend):
+    """
+    Registers a backend.
+
+    Args:
+        name (str): Name the backend is selected by.
+        backend (str or type): ``'package.module:ClassName'``, imported on first use, or the class itself.
+    """
+    BACKENDS[name] = backend
+
+
+def available():
+    """Returns the names of the registered backends."""
+    return sorted(BACKENDS)
+
+
+def get_backend(name):
+    """Returns the class of a registered backend, importing its module if needed."""
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown classifier backend '{name}', expected one of: {', '.join(available())}") from None
+    if isinstance(backend, str):
+        module, _, attribute = backend.partition(':')
+        backend = BACKENDS[name] = getattr(importlib.import_module(module), attribute)
+    return backend
+
+
+def create(name, **options):
+    """
+    Creates a backend from the options it accepts among ``options``; the others are ignored.
+
+    This lets callers pass one set of options (API key, cache, ...) whatever the backend.
+
+    Args:
+        name (str): Name of a registered backend.
+        **options: Constructor arguments.
+
+    Returns:
+        BiasClassifier: The backend instance.
+    """
+    backend = get_backend(name)
+    parameters = inspect.signature(backend).parameters
+    return backend(**{key: value for key, value in options.items() if key in parameters})
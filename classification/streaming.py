@@ -0,0 +1,171 @@
+#!/usr/bin/python
+
+import csv
+import json
+from itertools import islice
+import profiling
+from classification.checkpoint import Checkpoint
+from classification.columnar import ParquetResultWriter
+
+
+def iter_batches(chunks, batch_size=50, packer=None):
+    """
+    Groups sentences arriving in chunks into batches, without waiting for the last chunk.
+
+    Args:
+        chunks (iterable): Lists of sentences.
+        batch_size (int, optional): The size of each batch. Defaults to 50.
+        packer (BatchPacker, optional): Sizes the batches by token budget instead of ``batch_size``.
+
+    Yields:
+        tuple: ``(offset, sentences)``, where ``offset`` is the position of the first sentence of the batch.
+    """
+    pending = []
+    offset = 0
+    for chunk in chunks:
+        pending.extend(chunk)
+        if packer is None:
+            batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        else:
+            batches = packer.pack(pending)
+        # The last batch may still grow with the next chunk
+        for batch in batches[:-1]:
+            yield offset, batch
+            offset += len(batch)
+        pending = batches[-1] if batches else []
+    if pending:
+        yield offset, pending
+
+
+def iter_sentences(file_path, chunksize=10000, column='sentences'):
+    """Reads the sentences of a CSV file lazily, yielding lists of at most ``chunksize`` sentences."""
+    import pandas as pd
+    for chunk in pd.read_csv(file_path, usecols=[column], chunksize=chunksize):
+        yield chunk[column].tolist()
+
+
+def iter_sentence_batches(file_path, batch_size=50, chunksize=10000, column='sentences', packer=None):
+    """
+    Reads the sentences of a CSV file lazily and groups them into batches.
+
+    Args:
+        file_path (str): Path to the CSV file containing sentences.
+        batch_size (int, optional): The size of each batch. Defaults to 50.
+        chunksize (int, optional): Number of CSV rows read at a time. Defaults to 10000.
+        column (str, optional): Name of the column holding the sentences. Defaults to 'sentences'.
+        packer (BatchPacker, optional): Sizes the batches by token budget instead of ``batch_size``.
+
+    Yields:
+        tuple: ``(offset, sentences)``, where ``offset`` is the row number of the first sentence of the batch.
+    """
+    return iter_batches(iter_sentences(file_path, chunksize, column), batch_size, packer)
+
+
+def iter_classify_csv(classify, file_path, batch_size=50, chunksize=10000, output=None, checkpoint=None, packer=None):
+    """
+    Classifies the sentences of a CSV file batch by batch, yielding results as soon as each batch is answered.
+
+    Args:
+        classify (callable): Function classifying a list of sentences (e.g. ``classify_sentences``).
+        file_path (str): Path to the CSV file containing sentences.
+        batch_size (int, optional): The size of each batch. Defaults to 50.
+        chunksize (int, optional): Number of CSV rows read at a time. Defaults to 10000.
+        output (str, optional): CSV, JSONL (``.jsonl``) or Parquet (``.parquet``) file the results are also written
+            to, as they arrive.
+        checkpoint (str, optional): Checkpoint file of the job. Batches recorded in it are not classified again.
+        packer (BatchPacker, optional): Sizes the batches by token budget instead of ``batch_size``.
+
+    Yields:
+        dict: The result of a sentence, with its ``row`` number in the CSV file added.
+    """
+    return iter_classify_csv_batches(lambda batches: [classify(sentences) for sentences in batches], file_path,
+                                     batch_size, chunksize, output, checkpoint, packer, window=1)
+
+
+def iter_classify_csv_batches(classify_batches, file_path, batch_size=50, chunksize=10000, output=None,
+                              checkpoint=None, packer=None, window=32):
+    """
+    Classifies the sentences of a CSV file ``window`` batches at a time, e.g. with concurrent requests.
+
+    Only one window of batches is held in memory. The answered batches of a window are recorded in the checkpoint
+    before the error of a failed one is raised, so that a rerun with the same checkpoint only sends the others.
+
+    Args:
+        classify_batches (callable): Function classifying a list of batches, returning for each batch its list of
+            results, or the exception it failed with.
+        file_path (str): Path to the CSV file containing sentences.
+        batch_size (int, optional): The size of each batch. Defaults to 50.
+        chunksize (int, optional): Number of CSV rows read at a time. Defaults to 10000.
+        output (str, optional): CSV, JSONL (``.jsonl``) or Parquet (``.parquet``) file the results are also written
+            to, in input order.
+        checkpoint (str, optional): Checkpoint file of the job. Batches recorded in it are not classified again.
+        packer (BatchPacker, optional): Sizes the batches by token budget instead of ``batch_size``.
+        window (int, optional): Number of batches passed to ``classify_batches`` at a time. Defaults to 32.
+
+    Yields:
+        dict: The result of a sentence, with its ``row`` number in the CSV file added, in input order.
+    """
+    writer = result_writer(output) if output else None
+    token_budget = packer.token_budget if packer is not None else None
+    job = Checkpoint(checkpoint, file_path, batch_size, token_budget) if checkpoint else None
+    batches = iter_sentence_batches(file_path, batch_size, chunksize, packer=packer)
+    try:
+        for pending in profiling.timed_iter('read', iter(lambda: list(islice(batches, window)), [])):
+            todo = [(offset, sentences) for offset, sentences in pending
+                    if job is None or not job.has(offset, len(sentences))]
+            answers = {}
+            if todo:
+                with profiling.stage('classify'):
+                    answers = dict(zip([offset for offset, _ in todo], classify_batches([s for _, s in todo])))
+            with profiling.stage('write'):
+                for offset, sentences in todo:
+                    results = answers[offset]
+                    if not isinstance(results, BaseException):
+                        results = answers[offset] = [{**result, "row": offset + result["sentence_index"] - 1}
+                                                     for result in results]
+                        if job is not None:
+                            job.record(offset, len(sentences), results)
+
+            for offset, _ in pending:
+                results = answers[offset] if offset in answers else job.results(offset)
+                if isinstance(results, BaseException):
+                    raise results
+                if writer is not None:
+                    with profiling.stage('write'):
+                        writer.write_many(results)
+                yield from results
+    finally:
+        if writer is not None:
+            writer.close()
+        if job is not None:
+            job.close()
+
+
+def result_writer(path):
+    """Opens the writer matching the extension of ``path``: Parquet for ``.parquet``, otherwise CSV or JSONL."""
+    if path.endswith('.parquet'):
+        return ParquetResultWriter(path)
+    return ResultWriter(path)
+
+
+class ResultWriter:
+    """Writes classification results incrementally to a CSV file, or to a JSON Lines file for ``.jsonl`` paths."""
+
+    fields = ["row", "sentence_index", "bias", "explanation"]
+
+    def __init__(self, path):
+        self.jsonl = path.endswith('.jsonl')
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        if not self.jsonl:
+            self.writer = csv.DictWriter(self.file, fieldnames=self.fields, extrasaction='ignore')
+            self.writer.writeheader()
+
+    def write_many(self, results):
+        if self.jsonl:
+            self.file.writelines(json.dumps(result, ensure_ascii=False) + '\n' for result in results)
+        else:
+            self.writer.writerows(results)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
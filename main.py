@@ -1,87 +1,250 @@
 #!/usr/bin/python
 
 import argparse
-from classification.gender import GenderBiasChecker
-from preprocessing.preprocessor import TextPreprocessor, SentenceExtractor
-from classification.gpt import GPTBiasClassifier
-from classification.bard import BardBiasClassifier
+import sys
+import profiling
+from classification import registry
+from profiling import Profiler
 
 
 def main():
     parser = argparse.ArgumentParser(description="Text preprocessing and bias classification tool.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print per-stage timings and a cProfile summary of the command to stderr.")
+    parser.add_argument("--profile_output", type=str, help="With --profile, also save the raw profile to this file.")
     subparsers = parser.add_subparsers(dest="command")
 
+    # Options shared by the subcommands that process whole directories
+    execution_parser = argparse.ArgumentParser(add_help=False)
+    execution_parser.add_argument("-w", "--workers", type=int, default=1,
+                                  help="Number of processes used to handle files in parallel (default: 1).")
+    execution_parser.add_argument("--chunksize", type=int, default=1,
+                                  help="Number of files sent to a worker process at a time (default: 1).")
+    execution_parser.add_argument("-f", "--force", action="store_true",
+                                  help="Process every file again, even those whose outputs are up to date.")
+
+    # Options shared by the LLM classifiers
+    llm_parser = argparse.ArgumentParser(add_help=False)
+    llm_parser.add_argument("--cache", type=str, help="SQLite file caching results across runs.")
+    llm_parser.add_argument("--cache_size", type=int, default=1000000,
+                            help="Maximum number of cached results (least recently used ones are evicted).")
+    llm_parser.add_argument("--offline", action="store_true",
+                            help="Answer from the cache only, without calling the API.")
+    llm_parser.add_argument("-o", "--output", type=str,
+                            help="CSV, JSONL (.jsonl) or Parquet (.parquet) file batch results are written to "
+                                 "as they arrive.")
+    llm_parser.add_argument("--token_budget", type=int,
+                            help="Pack batch requests up to this many prompt and answer tokens "
+                                 "instead of 50 sentences.")
+    llm_parser.add_argument("--checkpoint", type=str,
+                            help="Checkpoint file of a batch job. Rerunning with it skips the finished batches.")
+    llm_parser.add_argument("-c", "--concurrency", type=int, default=1,
+                            help="Number of concurrent requests in batch mode (default: 1, sequential).")
+
+    # Options shared by the subcommands classifying sentences with a backend
+    dedup_parser = argparse.ArgumentParser(add_help=False)
+    dedup_parser.add_argument("--dedup", action="store_true",
+                              help="Classify repeated sentences only once and copy the result to every copy.")
+    dedup_parser.add_argument("--near_duplicates", type=float, metavar="THRESHOLD",
+                              help="Also treat sentences with at least this estimated similarity (0-1, e.g. 0.8) "
+                                   "as duplicates. Implies --dedup.")
+
     # Subparser for gender bias checking
-    gender_parser = subparsers.add_parser("gender", help="Check gender bias in text.")
+    gender_parser = subparsers.add_parser("gender", parents=[execution_parser], help="Check gender bias in text.")
     gender_parser.add_argument("-t", "--text", type=str, help="Text to analyze for gender bias.")
     gender_parser.add_argument("-b", "--batch", type=str, help="Directory containing files to analyze.")
+    gender_parser.add_argument("--format", type=str, choices=["csv", "parquet"], default="csv",
+                               help="Output format of the batch scores (parquet requires pyarrow).")
+    gender_parser.add_argument("-s", "--summarize", type=str,
+                               help="Directory or glob of -gender.csv/-gender.parquet files to summarize per area.")
 
     # Subparser for anonymizing text
     anonymize_parser = subparsers.add_parser("anonymize", help="Anonymize text.")
     anonymize_parser.add_argument("text", type=str, help="Text to anonymize.")
+    anonymize_parser.add_argument("--server", type=str,
+                                  help="URL of a running Stanford CoreNLP server used instead of the local tagger.")
 
     # Subparser for parsing HTML
-    parse_parser = subparsers.add_parser("parse", help="Parse HTML to text.")
+    parse_parser = subparsers.add_parser("parse", parents=[execution_parser], help="Parse HTML to text.")
     parse_parser.add_argument("directory", type=str, help="Directory containing HTML files to parse.")
 
     # Subparser for extracting sentences
-    extract_parser = subparsers.add_parser("extract", help="Extract sentences from text files.")
+    extract_parser = subparsers.add_parser("extract", parents=[execution_parser],
+                                           help="Extract sentences from text files.")
     extract_parser.add_argument("directory", type=str, help="Directory containing text files.")
 
+    # Subparser for the in-memory HTML -> sentences -> gender scores pipeline
+    pipeline_parser = subparsers.add_parser("pipeline", help="Parse HTML, extract sentences and check gender bias "
+                                                             "in one pass.")
+    pipeline_parser.add_argument("directory", type=str, help="Directory containing HTML files.")
+    pipeline_parser.add_argument("--keep_intermediate", action="store_true",
+                                 help="Also write the intermediate .txt and -sent.txt files.")
+    pipeline_parser.add_argument("--queue_size", type=int, default=16,
+                                 help="Maximum number of items waiting between two stages (default: 16).")
+
     # Subparsers for GPT and Bard bias classification (similar to gender bias)
-    gpt_parser = subparsers.add_parser("gpt", help="Check bias using GPT.")
+    gpt_parser = subparsers.add_parser("gpt", parents=[llm_parser, dedup_parser], help="Check bias using GPT.")
     gpt_parser.add_argument("-t", "--text", type=str, help="Text to analyze for bias using GPT.")
     gpt_parser.add_argument("-b", "--batch", type=str, help="Directory containing files to analyze using GPT.")
-    gpt_parser.add_argument("-k", "--api_key", type=str, help="Your OpenAI API key.", required=True)
+    gpt_parser.add_argument("-k", "--api_key", type=str, help="Your OpenAI API key (not needed with --offline).")
+    gpt_parser.add_argument("--rpm", type=int, default=500, help="Requests per minute limit in concurrent mode.")
+    gpt_parser.add_argument("--tpm", type=int, default=200000, help="Tokens per minute limit in concurrent mode.")
+    gpt_parser.add_argument("--base_url", type=str, help="Alternative OpenAI-compatible API endpoint.")
 
-    bard_parser = subparsers.add_parser("bard", help="Check bias using Bard.")
+    bard_parser = subparsers.add_parser("bard", parents=[llm_parser, dedup_parser], help="Check bias using Bard.")
     bard_parser.add_argument("-t", "--text", type=str, help="Text to analyze for bias using Bard.")
     bard_parser.add_argument("-b", "--batch", type=str, help="Directory containing files to analyze using Bard.")
-    bard_parser.add_argument("-k", "--api_key", type=str, help="Your Google Bard token.", required=True)
+    bard_parser.add_argument("-k", "--api_key", type=str, help="Your Google Bard token (not needed with --offline).")
+
+    # Subparser for any registered classifier backend
+    classify_parser = subparsers.add_parser("classify", parents=[dedup_parser],
+                                            help="Check bias with any classifier backend.")
+    classify_parser.add_argument("-m", "--model", type=str, choices=registry.available(), default="lexicon",
+                                 help="Classifier backend (default: lexicon, which runs locally).")
+    classify_parser.add_argument("-t", "--text", type=str, help="Text to analyze for bias.")
+    classify_parser.add_argument("-b", "--batch", type=str, help="CSV file with a 'sentences' column to analyze.")
+    classify_parser.add_argument("-k", "--api_key", type=str, help="API key or token of the gpt and bard backends.")
+    classify_parser.add_argument("--cache", type=str, help="SQLite file caching results across runs (LLM backends).")
+    classify_parser.add_argument("-o", "--output", type=str,
+                                 help="CSV, JSONL (.jsonl) or Parquet (.parquet) file results are written to.")
 
     args = parser.parse_args()
 
+    if args.command in ("gpt", "bard"):
+        if not args.api_key and not args.offline:
+            parser.error("the following arguments are required: -k/--api_key")
+        if args.offline and not args.cache:
+            parser.error("--offline requires --cache")
+        if (args.dedup or args.near_duplicates) and args.concurrency > 1:
+            parser.error("--dedup is not supported with --concurrency")
+
+    profiler = Profiler(enabled=args.profile)
+    profiling.activate(profiler)
+    with profiler.stage("setup"):
+        cache = None
+        if args.command in ("gpt", "bard", "classify") and args.cache:
+            from classification.cache import ResultCache
+            cache = ResultCache(args.cache, max_entries=getattr(args, "cache_size", 1000000))
+        dedup = None
+        if args.command in ("gpt", "bard", "classify") and (args.dedup or args.near_duplicates):
+            from preprocessing.dedup import Deduplicator
+            dedup = Deduplicator(near_duplicates=args.near_duplicates is not None,
+                                 threshold=args.near_duplicates or 0.8)
+
+    parsers = {None: parser, "gender": gender_parser, "gpt": gpt_parser, "bard": bard_parser,
+               "classify": classify_parser}
+    with profiler.stage(args.command or "help"):
+        run_command(args, cache, dedup, parsers)
+
+    if cache is not None:
+        print(f"Cache: {cache.hits} hits, {cache.misses} misses, {len(cache)} entries", file=sys.stderr)
+        cache.close()
+    if dedup is not None:
+        print(dedup.report(), file=sys.stderr)
+    profiler.report(args.profile_output)
+
+
+def run_command(args, cache, dedup, parsers):
+    """Runs the subcommand of the parsed ``args``; ``parsers`` maps subcommands to their parser, for help."""
     if args.command == "gender":
+        GenderBiasChecker = registry.get_backend("gender")
         gbc = GenderBiasChecker()
         if args.text:
             a, b, c = gbc.check_bias(args.text)
             print("Result: {}\nMasculine: {}\nFeminine: {}".format(c, a, b))
         elif args.batch:
-            gbc.check_bias_batch(args.batch)
+            gbc.check_bias_batch(args.batch, workers=args.workers, chunksize=args.chunksize,
+                                 force=args.force, output_format=args.format)
+        elif args.summarize:
+            print(GenderBiasChecker.summarize_area(args.summarize, workers=args.workers).to_csv(), end='')
         else:
-            gender_parser.print_help()
+            parsers[args.command].print_help()
     elif args.command == "anonymize":
+        from preprocessing.preprocessor import TextPreprocessor
+        if args.server:
+            TextPreprocessor.use_ner_server(args.server)
         print(TextPreprocessor.anonymize(args.text))
     elif args.command == "parse":
-        TextPreprocessor.parse_html_batch(args.directory)
+        from preprocessing.preprocessor import TextPreprocessor
+        TextPreprocessor.parse_html_batch(args.directory, workers=args.workers, chunksize=args.chunksize,
+                                          force=args.force)
     elif args.command == "extract":
-        SentenceExtractor.extract_sentences_batch(args.directory)
+        from preprocessing.preprocessor import SentenceExtractor
+        SentenceExtractor.extract_sentences_batch(args.directory, workers=args.workers, chunksize=args.chunksize,
+                                                  force=args.force)
+    elif args.command == "pipeline":
+        from pipeline import run_pipeline
+        run_pipeline(args.directory, keep_intermediate=args.keep_intermediate, queue_size=args.queue_size)
     elif args.command == "gpt":
-        gpt_classifier = GPTBiasClassifier(api_key=args.api_key)
+        gpt_classifier = registry.create("gpt", api_key=args.api_key, base_url=args.base_url, cache=cache,
+                                         offline=args.offline, token_budget=args.token_budget)
         if args.text:
             results = gpt_classifier.classify_sentences([args.text])
             for result in results:
                 print(result)
         elif args.batch:
-            results = gpt_classifier.classify_from_csv(args.batch)
+            if args.concurrency > 1:
+                results = gpt_classifier.iter_classify_from_csv_async(
+                    args.batch, output=args.output, checkpoint=args.checkpoint, max_concurrency=args.concurrency,
+                    requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+            else:
+                results = gpt_classifier.iter_classify_from_csv(args.batch, output=args.output,
+                                                                checkpoint=args.checkpoint, dedup=dedup)
             for result in results:
-                print(result)
+                if not args.output:
+                    print(result)
         else:
-            gpt_parser.print_help()
+            parsers[args.command].print_help()
     elif args.command == "bard":
-        bard_classifier = BardBiasClassifier(token=args.api_key)
+        bard_classifier = registry.create("bard", token=args.api_key, cache=cache, offline=args.offline,
+                                          token_budget=args.token_budget)
         if args.text:
             results = bard_classifier.classify_sentences([args.text])
             for result in results:
                 print(result)
         elif args.batch:
-            results = bard_classifier.classify_from_csv(args.batch)
+            if args.concurrency > 1:
+                results = bard_classifier.iter_classify_from_csv_concurrent(
+                    args.batch, output=args.output, checkpoint=args.checkpoint, max_concurrency=args.concurrency)
+            else:
+                results = bard_classifier.iter_classify_from_csv(args.batch, output=args.output,
+                                                                 checkpoint=args.checkpoint, dedup=dedup)
             for result in results:
-                print(result)
+                if not args.output:
+                    print(result)
+        else:
+            parsers[args.command].print_help()
+    elif args.command == "classify":
+        if args.text or args.batch:
+            classifier = registry.create(args.model, api_key=args.api_key, token=args.api_key, cache=cache)
+            if args.text:
+                sentences = [args.text]
+            else:
+                from classification.streaming import iter_sentences
+                sentences = (sentence for chunk in profiling.timed_iter("read", iter_sentences(args.batch))
+                             for sentence in chunk)
+            if dedup is not None:
+                results = dedup.classify_batch(classifier.classify_batch, sentences)
+            else:
+                results = classifier.classify_batch(sentences)
+            results = profiling.timed_iter("classify", results)
+            if args.output:
+                from classification.base import iter_chunks
+                from classification.streaming import result_writer
+                writer = result_writer(args.output)
+                try:
+                    for chunk in iter_chunks(results, 10000):
+                        with profiling.stage("write"):
+                            writer.write_many([{**result, "row": result["sentence_index"] - 1} for result in chunk])
+                finally:
+                    writer.close()
+            else:
+                for result in results:
+                    print(result)
         else:
-            bard_parser.print_help()
+            parsers[args.command].print_help()
     else:
-        parser.print_help()
+        parsers[None].print_help()
 
 
 if __name__ == "__main__":
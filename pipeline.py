@@ -0,0 +1,171 @@
+#!/usr/bin/python
+
+import csv
+import io
+import multiprocessing
+import os
+from queue import Full
+from tqdm import tqdm
+import profiling
+from profiling import Stopwatch
+from classification.gender import GenderBiasChecker, CSV_HEADER
+from preprocessing.preprocessor import TextPreprocessor, SentenceExtractor
+
+
+"""
+In-memory HTML -> sentences -> gender scores pipeline.
+
+Each stage runs in its own process and hands its output to the next one through a bounded queue, so parsing,
+sentence extraction and scoring overlap. For every input.html, the scores are written to input-sent-gender.csv,
+the same file 'parse', 'extract' and 'gender -b' would produce. The intermediate input.txt and input-sent.txt
+files are only written when asked for.
+"""
+
+# Seconds between two checks that the stages are still alive while waiting on them
+POLL_INTERVAL = 1.0
+
+
+def extract_stage(texts, sentences, keep_intermediate, batch_size, timings):
+    """
+    Turns ``(path, text)`` messages into ``('sentences', path, batch)`` and ``('end', path, None)`` messages.
+
+    Puts the time spent splitting sentences on ``timings`` when done.
+    """
+    busy = Stopwatch()
+    for path, text in iter(texts.get, None):
+        base = os.path.splitext(path)[0]
+        sent_file = open(base + '-sent.txt', 'w', encoding='utf8') if keep_intermediate else None
+        try:
+            batch = []
+            for sent in busy.iter(SentenceExtractor.split_sentences(io.StringIO(text, newline=None))):
+                batch.append(sent + '\n')
+                if len(batch) >= batch_size:
+                    sentences.put(('sentences', path, batch))
+                    if sent_file is not None:
+                        sent_file.writelines(batch)
+                    batch = []
+            if sent_file is not None:
+                sent_file.writelines(batch)
+            sentences.put(('sentences', path, batch))
+            sentences.put(('end', path, None))
+        except Exception as e:
+            sentences.put(('fail', path, str(e)))
+        finally:
+            if sent_file is not None:
+                sent_file.close()
+    sentences.put(None)
+    timings.put(('extract', busy.seconds))
+
+
+def score_stage(sentences, checker, timings):
+    """
+    Writes the gender scores of ``('sentences', path, batch)`` messages to each file's CSV.
+
+    A file that cannot be scored or written is reported as failed and its later messages are skipped, so the stage
+    keeps draining the queue and the extract stage never blocks on it. Puts the time spent scoring and writing on
+    ``timings`` when done.
+    """
+    busy = Stopwatch()
+    outputs = {}
+    failed = set()
+    for kind, path, payload in iter(sentences.get, None):
+        output_file = os.path.splitext(path)[0] + '-sent-gender.csv'
+        if kind == 'sentences':
+            if path in failed:
+                continue
+            try:
+                if path not in outputs:
+                    csvfile = open(output_file, 'w', newline='')
+                    outputs[path] = (csvfile, csv.writer(csvfile))
+                    outputs[path][1].writerow(CSV_HEADER)
+                with busy:
+                    checker.write_bias_rows(outputs[path][1], payload)
+            except Exception as e:
+                failed.add(path)
+                kind, payload = 'fail', str(e)
+            else:
+                continue
+        elif path in failed:
+            failed.discard(path)
+            continue
+
+        csvfile, _ = outputs.pop(path, (None, None))
+        if csvfile is not None:
+            csvfile.close()
+        if kind == 'fail':
+            if csvfile is not None:
+                os.remove(output_file)
+            print(f'fail: {os.path.basename(path)} ({payload})')
+    timings.put(('score', busy.seconds))
+
+
+def put(queue, item, stages):
+    """Puts ``item`` on a bounded queue, raising instead of blocking forever if a stage died."""
+    while True:
+        try:
+            queue.put(item, timeout=POLL_INTERVAL)
+            return
+        except Full:
+            check_stages(stages)
+
+
+def check_stages(stages):
+    for stage in stages:
+        if stage.exitcode not in (None, 0):
+            raise RuntimeError(f'pipeline stage {stage.name} exited with code {stage.exitcode}')
+
+
+def join_stages(stages):
+    """Waits for the stages to finish, raising as soon as one of them fails."""
+    for stage in stages:
+        while stage.is_alive():
+            stage.join(POLL_INTERVAL)
+            check_stages(stages)
+    check_stages(stages)
+
+
+def run_pipeline(in_dir, keep_intermediate=False, queue_size=16, batch_size=10000):
+    """
+    Parses, splits and scores every HTML file of a directory in one pass.
+
+    Args:
+        in_dir (str): Directory containing the HTML files.
+        keep_intermediate (bool, optional): Also write the .txt and -sent.txt files. Defaults to False.
+        queue_size (int, optional): Maximum number of messages waiting between two stages. Defaults to 16.
+        batch_size (int, optional): Number of sentences sent to the scoring stage at a time. Defaults to 10000.
+    """
+    texts = multiprocessing.Queue(queue_size)
+    sentences = multiprocessing.Queue(queue_size)
+    timings = multiprocessing.Queue()
+    stages = [multiprocessing.Process(target=extract_stage, name='extract',
+                                      args=(texts, sentences, keep_intermediate, batch_size, timings)),
+              multiprocessing.Process(target=score_stage, args=(sentences, GenderBiasChecker(), timings),
+                                      name='score')]
+    for stage in stages:
+        stage.start()
+
+    try:
+        for f in tqdm(os.listdir(in_dir), desc='pipeline'):
+            if not f.endswith(('.html', '.htm')):
+                continue
+            path = os.path.join(in_dir, f)
+            try:
+                with profiling.stage('parse'):
+                    text = TextPreprocessor.html_to_text(path)
+                if keep_intermediate:
+                    with open(os.path.splitext(path)[0] + '.txt', 'w', encoding="utf-8") as out:
+                        out.write(text)
+            except Exception as e:
+                print(f'fail: {f} ({e})')
+                continue
+            put(texts, (path, text), stages)
+        put(texts, None, stages)
+        join_stages(stages)
+        for _ in stages:  # Busy time of the stage processes, which run alongside the parsing above
+            profiling.record(*timings.get(timeout=POLL_INTERVAL))
+    finally:
+        if any(stage.is_alive() for stage in stages):  # Interrupted, or a stage died: stop the others
+            texts.cancel_join_thread()
+            for stage in stages:
+                stage.terminate()
+                stage.join()
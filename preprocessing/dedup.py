@@ -0,0 +1,158 @@
+#!/usr/bin/python
+
+import hashlib
+import zlib
+from itertools import islice
+import numpy as np
+from classification.cache import normalize_sentence
+
+
+MERSENNE_PRIME = (1 << 31) - 1
+SHINGLE_SIZE = 5
+MAX_BUCKET_SIZE = 32  # Sentences kept per LSH bucket, bounding the comparisons made for each new sentence
+
+
+class Deduplicator:
+    """
+    Index of the sentences seen so far, mapping every sentence to the id of its first occurrence.
+
+    Exact duplicates (after ``normalize_sentence``) are found with a set of 128-bit hashes. With ``near_duplicates`` set,
+    sentences that are not exact duplicates are also compared through MinHash signatures of their character
+    5-grams: locality-sensitive hashing over ``bands`` bands finds candidates in constant time, and a candidate is
+    accepted when the signatures estimate a Jaccard similarity of at least ``threshold``.
+
+    Memory grows with the number of unique sentences (a hash each, plus a signature each for near-duplicates).
+    """
+
+    def __init__(self, near_duplicates=False, threshold=0.8, num_perm=64, bands=8, seed=1):
+        """
+        Args:
+            near_duplicates (bool, optional): Also merge near-duplicates. Defaults to False.
+            threshold (float, optional): Minimum estimated Jaccard similarity of near-duplicates. Defaults to 0.8.
+            num_perm (int, optional): Size of the MinHash signatures. Defaults to 64.
+            bands (int, optional): Number of LSH bands; ``num_perm`` must be a multiple of it. Defaults to 8.
+            seed (int, optional): Seed of the hash permutations. Defaults to 1.
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.near_duplicates = near_duplicates
+        self.threshold = threshold
+        self.bands = bands
+        self.ids = {}
+        self.occurrences = []
+        self.exact = 0
+        self.near = 0
+        if near_duplicates:
+            rng = np.random.default_rng(seed)
+            self.a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+            self.b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+            self.buckets = {}
+            self.signatures = []
+
+    def __len__(self):
+        return len(self.occurrences)
+
+    def signature(self, text):
+        """MinHash signature of the lowercased character shingles of a normalized sentence."""
+        text = text.lower()
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+        hashes = np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in shingles], dtype=np.uint64)
+        # a, b < 2**31 and hashes < 2**32, so a * hash + b cannot overflow 64 bits
+        return ((np.outer(hashes, self.a) + self.b) % np.uint64(MERSENNE_PRIME)).min(axis=0)
+
+    def add(self, sentence):
+        """
+        Registers one occurrence of ``sentence``.
+
+        Returns:
+            tuple: ``(id, new)``: the id of the first occurrence of the sentence (or of the sentence it nearly
+            duplicates), and whether this occurrence is the first one.
+        """
+        text = normalize_sentence(sentence)
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        sentence_id = self.ids.get(digest)
+        if sentence_id is not None:
+            self.exact += 1
+            self.occurrences[sentence_id] += 1
+            return sentence_id, False
+
+        if self.near_duplicates:
+            signature = self.signature(text)
+            rows = len(signature) // self.bands
+            keys = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+            candidates = (candidate for key in keys for candidate in self.buckets.get(key, ()))
+            for candidate in dict.fromkeys(candidates):
+                if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                    self.ids[digest] = candidate
+                    self.near += 1
+                    self.occurrences[candidate] += 1
+                    return candidate, False
+
+        sentence_id = self.ids[digest] = len(self.occurrences)
+        self.occurrences.append(1)
+        if self.near_duplicates:
+            self.signatures.append(signature)
+            for key in keys:
+                bucket = self.buckets.setdefault(key, [])
+                if len(bucket) < MAX_BUCKET_SIZE:
+                    bucket.append(sentence_id)
+        return sentence_id, True
+
+    def wrap(self, classify):
+        """
+        Wraps a batch classifier so that it is only called on sentences not seen before.
+
+        Results of earlier sentences are kept and copied to their later duplicates, within and across batches.
+
+        Args:
+            classify (callable): Function classifying a list of sentences into result dictionaries holding a 1-based
+                ``sentence_index`` (e.g. ``classify_sentences``).
+
+        Returns:
+            callable: A function with the same signature and results.
+        """
+        results = {}
+
+        def classify_unique(sentences):
+            ids = [self.add(sentence)[0] for sentence in sentences]
+            pending = {}
+            for sentence, sentence_id in zip(sentences, ids):
+                if sentence_id not in results and sentence_id not in pending:
+                    pending[sentence_id] = sentence
+            order = list(pending)
+            if order:
+                for result in classify([pending[sentence_id] for sentence_id in order]):
+                    results[order[result["sentence_index"] - 1]] = result
+            return [{**results[sentence_id], "sentence_index": i}
+                    for i, sentence_id in enumerate(ids, 1) if sentence_id in results]
+
+        return classify_unique
+
+    def classify_batch(self, classify_batch, sentences, chunk_size=10000):
+        """
+        Runs a ``BiasClassifier.classify_batch`` on the unique sentences of a stream only.
+
+        The stream is read ``chunk_size`` sentences at a time; the new sentences of a chunk are classified together,
+        so that requests stay full, and every result is copied to all the occurrences of its sentence.
+
+        Args:
+            classify_batch (callable): The ``classify_batch`` method of a backend.
+            sentences (iterable): Sentences to classify.
+            chunk_size (int, optional): Number of sentences read at a time. Defaults to 10000.
+
+        Yields:
+            dict: One result per classified sentence, indexed by position in ``sentences``.
+        """
+        classify = self.wrap(lambda unique: list(classify_batch(unique)))
+        sentences = iter(sentences)
+        offset = 0
+        for chunk in iter(lambda: list(islice(sentences, chunk_size)), []):
+            for result in classify(chunk):
+                yield {**result, "sentence_index": offset + result["sentence_index"]}
+            offset += len(chunk)
+
+    def report(self):
+        """Returns a one-line summary of the duplicates found."""
+        total = len(self) + self.exact + self.near
+        return (f"Duplicates: {self.exact} exact and {self.near} near-duplicate of {total} sentences "
+                f"({len(self)} unique, {1 - len(self) / total if total else 0:.1%} not classified again)")
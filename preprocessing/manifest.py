@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+import hashlib
+import json
+import os
+
+
+MANIFEST_NAME = '.manifest.json'
+
+
+def fingerprint(path, previous=None):
+    """
+    Describes the current state of a file by its size, modification time and SHA-256.
+
+    The file is only hashed again when its size or modification time differ from ``previous``.
+    """
+    stat = os.stat(path)
+    if previous is not None and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime_ns:
+        return previous
+
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': sha256.hexdigest()}
+
+
+class Manifest:
+    """
+    Records which inputs, in which state, every derived file was built from, so reruns only rebuild stale files.
+
+    An output is stale when it is missing, was never recorded, was built from other inputs, or when one of its
+    inputs changed content since. Touched but unchanged inputs are not stale. Since every stage records its own
+    inputs, a changed source also makes the files derived from its outputs stale in the following stages.
+    """
+
+    def __init__(self, path, force=False):
+        self.path = path
+        self.force = force
+        self.outputs = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf8') as f:
+                self.outputs = json.load(f)['outputs']
+
+    def is_stale(self, inputs, outputs):
+        if self.force:
+            return True
+        for output in outputs:
+            recorded = self.outputs.get(os.path.abspath(output))
+            if not os.path.exists(output) or recorded is None:
+                return True
+            if set(recorded) != {os.path.abspath(i) for i in inputs}:
+                return True
+            for i in inputs:
+                if not os.path.exists(i):
+                    return True
+                previous = recorded[os.path.abspath(i)]
+                if fingerprint(i, previous)['sha256'] != previous['sha256']:
+                    return True
+        return False
+
+    def record(self, inputs, outputs):
+        state = {os.path.abspath(i): fingerprint(i) for i in inputs}
+        for output in outputs:
+            self.outputs[os.path.abspath(output)] = state
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf8') as f:
+            json.dump({'outputs': self.outputs}, f, indent=1)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+
+def _call(func, args):
+    try:
+        func(*args)
+    except Exception as e:
+        return e
+    return None
+
+
+def _apply(func, args):
+    return func(*args)
+
+
+def run_parallel(func, arg_list, workers=1, chunksize=1, desc=None):
+    """
+    Calls ``func(*args)`` for every tuple in ``arg_list``, optionally across a pool of processes.
+
+    Each call is isolated: an exception is caught where it happens and handed back instead of stopping the batch.
+    Every call writes its own output file, so the files produced are the same whatever the number of workers.
+
+    Args:
+        func (callable): A picklable function (module-level function, static method or bound method).
+        arg_list (list): Argument tuples, one per call.
+        workers (int, optional): Number of processes. 1 runs every call in the current process. Defaults to 1.
+        chunksize (int, optional): Number of calls sent to a worker at a time. Defaults to 1.
+        desc (str, optional): Label of the progress bar.
+
+    Returns:
+        list: ``(args, error)`` pairs in input order, where ``error`` is the exception raised by the call or None.
+    """
+    call = functools.partial(_call, func)
+    if workers <= 1:
+        errors = list(tqdm(map(call, arg_list), total=len(arg_list), desc=desc))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            errors = list(tqdm(pool.map(call, arg_list, chunksize=chunksize), total=len(arg_list), desc=desc))
+    return list(zip(arg_list, errors))
+
+
+def map_parallel(func, arg_list, workers=1, chunksize=1, desc=None):
+    """
+    Returns ``func(*args)`` for every tuple in ``arg_list``, optionally computed across a pool of processes.
+
+    Unlike ``run_parallel``, the results are handed back and the first exception raised by a call is re-raised.
+
+    Args:
+        func (callable): A picklable function (module-level function, static method or bound method).
+        arg_list (list): Argument tuples, one per call.
+        workers (int, optional): Number of processes. 1 runs every call in the current process. Defaults to 1.
+        chunksize (int, optional): Number of calls sent to a worker at a time. Defaults to 1.
+        desc (str, optional): Label of the progress bar.
+
+    Returns:
+        list: The results of the calls, in input order.
+    """
+    call = functools.partial(_apply, func)
+    if workers <= 1:
+        return list(tqdm(map(call, arg_list), total=len(arg_list), desc=desc))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(tqdm(pool.map(call, arg_list, chunksize=chunksize), total=len(arg_list), desc=desc))
@@ -8,9 +8,24 @@ from nltk.tag.stanford import StanfordNERTagger
 import re
 import csv
 import random
+import shutil
 import string
+import profiling
+from preprocessing.parallel import run_parallel
+from preprocessing.manifest import Manifest, MANIFEST_NAME
+from preprocessing.sampling import stratified_sample
 
 
+URL_PATTERN = re.compile(r"http\S+")
+EMAIL_PATTERN = re.compile(r'\S*@\S*\s?')
+UNWANTED_CHARS_PATTERN = re.compile(r"[^a-zA-Z1-9 ?!,.:';]+")
+PUNCTUATION_SPACING = str.maketrans({c: ' ' + c + ' ' for c in "?!,.:';"})
+MULTIPLE_SPACES_PATTERN = re.compile(' {2,}')
+BOLD_PATTERN = re.compile(r"\*\*.*?\*\*")
+BRACKETS_PATTERN = re.compile(r"[\(\{\[].*?[\)\}\]]")
+NON_PRINTABLE_PATTERN = re.compile('[^' + re.escape(string.printable) + ']+')
+COPY_BUFFER_SIZE = 1 << 20
+
 java_path = "C:\Program Files (x86)\Common Files\Oracle\Java\javapath"
 os.environ['JAVAHOME'] = java_path
 
@@ -19,96 +34,181 @@ class TextPreprocessor:
     """Handles initial text cleaning and parsing tasks."""
 
     @staticmethod
-    def parse_html(file):
+    def html_to_text(file):
         with open(file, encoding="utf-8") as f:
-            content = html2text.html2text(f.read())
-            new_file = file.split('.')[0] + '.txt'
+            return html2text.html2text(f.read())
 
-            with open(new_file, 'w', encoding="utf-8") as out:
-                out.write(content)
-            print('success: ' + file)
+    @staticmethod
+    def text_file(file):
+        return file.split('.')[0] + '.txt'
 
     @staticmethod
-    def parse_html_batch(in_dir):
-        for f in os.listdir(in_dir):
-            try:
-                TextPreprocessor.parse_html(os.path.join(in_dir, f))
-            except:
-                print('fail: ' + f)
+    def parse_html(file):
+        with profiling.stage('parse'):
+            content = TextPreprocessor.html_to_text(file)
+        new_file = TextPreprocessor.text_file(file)
+
+        with profiling.stage('write'), open(new_file, 'w', encoding="utf-8") as out:
+            out.write(content)
+        print('success: ' + file)
 
     @staticmethod
-    def anonymize(text):
-        st = StanfordNERTagger(r"english.all.3class.distsim.crf.ser.gz",
-                               r"stanford-ner.jar",
-                               encoding='utf-8')
-        tagged_sentence = st.tag(text.split())
-        edited_sentence = []
-        for word, tag in tagged_sentence:
-            if tag != 'PERSON':
-                w = word
+    def parse_html_batch(in_dir, workers=1, chunksize=1, force=False):
+        manifest = Manifest(os.path.join(in_dir, MANIFEST_NAME), force)
+        files = [(os.path.join(in_dir, f),) for f in os.listdir(in_dir) if f.endswith(('.html', '.htm'))]
+        files = [(file,) for (file,) in files if manifest.is_stale([file], [TextPreprocessor.text_file(file)])]
+        for (file,), error in run_parallel(TextPreprocessor.parse_html, files, workers, chunksize, desc='parse'):
+            if error is not None:
+                print('fail: ' + os.path.basename(file))
             else:
-                w = 'ANONYMIZED'
-            edited_sentence.append(w)
-        return ' '.join(edited_sentence)
+                manifest.record([file], [TextPreprocessor.text_file(file)])
+        manifest.save()
+
+    ner_tagger = None
+
+    @staticmethod
+    def get_ner_tagger():
+        """Returns the NER tagger shared by all calls, creating the Stanford NER tagger on first use."""
+        if TextPreprocessor.ner_tagger is None:
+            TextPreprocessor.ner_tagger = StanfordNERTagger(r"english.all.3class.distsim.crf.ser.gz",
+                                                            r"stanford-ner.jar",
+                                                            encoding='utf-8')
+        return TextPreprocessor.ner_tagger
+
+    @staticmethod
+    def use_ner_server(url="http://localhost:9000"):
+        """Tags through a running Stanford CoreNLP server instead of starting a JVM for each tagging call."""
+        from nltk.parse.corenlp import CoreNLPParser
+        TextPreprocessor.ner_tagger = CoreNLPParser(url=url, tagtype='ner')
+
+    @staticmethod
+    def anonymize_many(texts, batch_size=1000):
+        """
+        Replaces person names with 'ANONYMIZED' in many texts.
+
+        The texts are tagged ``batch_size`` at a time with ``tag_sents``, so the Stanford tagger starts one JVM per
+        batch rather than one per text.
+        """
+        tagger = TextPreprocessor.get_ner_tagger()
+        tokens = [text.split() for text in texts]
+        non_empty = [words for words in tokens if words]
+        tagged = []
+        for i in range(0, len(non_empty), batch_size):
+            tagged.extend(tagger.tag_sents(non_empty[i:i + batch_size]))
+
+        tagged = iter(tagged)
+        edited = []
+        for words in tokens:
+            tagged_sentence = next(tagged) if words else []
+            edited.append(' '.join('ANONYMIZED' if tag == 'PERSON' else word for word, tag in tagged_sentence))
+        return edited
+
+    @staticmethod
+    def anonymize(text):
+        return TextPreprocessor.anonymize_many([text])[0]
 
     @staticmethod
     def remove_multiple_spaces(text):
-        if '  ' in text:
-            t = text.replace('  ', ' ')
-            return TextPreprocessor.remove_multiple_spaces(t)
-        else:
-            return text
+        return MULTIPLE_SPACES_PATTERN.sub(' ', text)
+
     @staticmethod
     def clean_sentence(text):
-        out_text = ''
-        text = re.sub(r"http\S+", "", text)  # removes urls
-        text = re.sub(r'\S*@\S*\s?', 'EMAIL', text)  # removes e-mail addresses
+        text = URL_PATTERN.sub("", text)  # removes urls
+        text = EMAIL_PATTERN.sub('EMAIL', text)  # removes e-mail addresses
         text = text.replace('_', ' ').replace('  ', ' ')
-        for x in text:  # add space before and after punctuation
-            if re.match('[\?\!,\.:\';]', x):
-                xx = ' ' + x + ' '
-                xx.replace('  ', ' ')
-            elif re.match('[a-zA-Z1-9 ]', x):
-                xx = x
-            else:
-                continue
+        text = UNWANTED_CHARS_PATTERN.sub('', text)  # keeps letters, digits 1-9, spaces and punctuation
+        return text.translate(PUNCTUATION_SPACING).lower().replace('  ', ' ')  # adds spaces around punctuation
+
+    @staticmethod
+    def clean_many(texts):
+        clean_sentence = TextPreprocessor.clean_sentence
+        return [clean_sentence(text) for text in texts]
 
-            out_text += xx
-        out = out_text.lower()
-        return re.sub('  ', ' ', out)
 
 class SentenceExtractor:
     """Focuses on extracting and formatting sentences from text."""
 
     @staticmethod
-    def extract_sentences(src_name, dst_name):
-        content = []
+    def clean_line(line):
+        """Removes titles, bold text, bracketed asides and transcript markers from a line (None for titles)."""
+        if '#' in line:  # Ignores titles
+            return None
+        temp1 = BOLD_PATTERN.sub("", line).replace(' : ', '').replace('_', '')
+        return BRACKETS_PATTERN.sub("", temp1).replace('- END OF TRANSCRIPT -', '')
+
+    @staticmethod
+    def iter_sentences(src_name, chunk_size=1 << 20):
+        """Streams the sentences of a text file (see ``split_sentences``)."""
         with open(src_name, encoding="utf8") as f:
-            lines = f.readlines()
-            for l in lines:
-                if '#' in l: continue  # Ignores titles
-                temp1 = re.sub("\*\*.*?\*\*", "", l) \
-                    .replace(' : ', '').replace('_', '')
-                temp2 = re.sub("[\(\{\[].*?[\)\}\]]", "", temp1).replace('- END OF TRANSCRIPT -', '')
-                content.append(temp2)
-        text = ' '.join(content)
-        txt = TextPreprocessor.remove_multiple_spaces(text.replace('\n', ' '))
+            yield from SentenceExtractor.split_sentences(f, chunk_size)
 
+    @staticmethod
+    def split_sentences(lines, chunk_size=1 << 20):
+        """
+        Streams the sentences of an iterable of text lines.
+
+        Cleaned lines are accumulated up to ``chunk_size`` characters and split with ``sent_tokenize``. The end of a
+        chunk may cut the last sentence, so its text is carried over and tokenized again with the next chunk. A last
+        sentence longer than ``chunk_size`` is cut at its last space instead, so that memory stays bounded on text
+        without sentence boundaries (e.g. unpunctuated transcripts).
+        """
+        carry = ''
+        pieces = []
+        size = 0
+        for l in lines:
+            piece = SentenceExtractor.clean_line(l)
+            if piece is None:
+                continue
+            pieces.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                text = SentenceExtractor.join_chunk(carry, pieces)
+                sentences = nltk.tokenize.sent_tokenize(text)
+                start = text.rfind(sentences[-1]) if sentences else len(text)
+                carry = (text[start:] if start >= 0 else text).rstrip()
+                yield from SentenceExtractor.filter_sentences(sentences[:-1])
+                if len(carry) > chunk_size:
+                    cut = carry.rfind(' ')
+                    if cut > 0:
+                        yield from SentenceExtractor.filter_sentences([carry[:cut]])
+                        carry = carry[cut + 1:]
+                pieces = []
+                size = 0
+        text = SentenceExtractor.join_chunk(carry, pieces)
+        yield from SentenceExtractor.filter_sentences(nltk.tokenize.sent_tokenize(text))
+
+    @staticmethod
+    def join_chunk(carry, pieces):
+        text = ' '.join(([carry] if carry else []) + pieces)
+        return TextPreprocessor.remove_multiple_spaces(text.replace('\n', ' '))
+
+    @staticmethod
+    def filter_sentences(sentences):
+        for s in sentences:
+            s = BRACKETS_PATTERN.sub("", s)
+            if len(s.split(' ')) > 2:
+                yield TextPreprocessor.remove_multiple_spaces(s)
+
+    @staticmethod
+    def extract_sentences(src_name, dst_name, chunk_size=1 << 20):
         with open(dst_name, 'w', encoding="utf8") as dst_file:
-            data = nltk.tokenize.sent_tokenize(txt)
-            temp = [re.sub("[\(\{\[].*?[\)\}\]]", "", s) for s in data]
-            data2 = [s for s in temp if len(s.split(' ')) > 2]
-            for sent in data2:
-                cnt = TextPreprocessor.remove_multiple_spaces(sent) + '\n'
-                dst_file.write(cnt.replace('\n ', '\n'))
+            for sent in profiling.timed_iter('extract', SentenceExtractor.iter_sentences(src_name, chunk_size)):
+                dst_file.write(sent + '\n')
 
     @staticmethod
-    def extract_sentences_batch(input_dir, output_dir):
-        for f in tqdm(os.listdir(input_dir)):
-            if '.txt' in f:
-                src = os.path.join(output_dir, f)
-                dst = os.path.join(output_dir, f.replace('.txt', '-sent.txt'))
-                SentenceExtractor.extract_sentences(src, dst)
+    def extract_sentences_batch(input_dir, output_dir=None, workers=1, chunksize=1, force=False):
+        output_dir = input_dir if output_dir is None else output_dir
+        manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME), force)
+        files = [(os.path.join(input_dir, f), os.path.join(output_dir, f.replace('.txt', '-sent.txt')))
+                 for f in os.listdir(input_dir) if '.txt' in f and not f.endswith('-sent.txt')]
+        files = [(src, dst) for src, dst in files if manifest.is_stale([src], [dst])]
+        for (src, dst), error in run_parallel(SentenceExtractor.extract_sentences, files, workers, chunksize,
+                                              desc='extract'):
+            if error is not None:
+                print('fail: ' + os.path.basename(src))
+            else:
+                manifest.record([src], [dst])
+        manifest.save()
 
     @staticmethod
     def format_input(src_dir):
@@ -116,16 +216,13 @@ class SentenceExtractor:
             out_file = src_dir + f.replace('.txt', '-formatted.txt')
             with open(src_dir + f, encoding='utf8') as file:
                 lines = file.readlines()
+                texts = TextPreprocessor.clean_many(NON_PRINTABLE_PATTERN.sub('', l) for l in lines)
                 out_lines = []
-                i = 1
-                for l in lines:
-                    text = ''.join([x for x in l if x in string.printable])
-                    text = TextPreprocessor.clean_sentence(text)
+                for i, text in enumerate(texts, start=1):
                     text = text.replace('\n', ' ').replace('\t', ' ')
                     new_line = (src_dir + f + str(i)) + '\t' + ((text + '\t') * 4) + '\n'
                     new_line = new_line.replace('\t\n', '\n')  # Removes last tab
                     out_lines.append(new_line)
-                    i += 1
                 with open(out_file, 'w') as out:
                     out.writelines(out_lines)
 
@@ -136,52 +233,100 @@ class DataOrganizer:
     @staticmethod
     def get_modules_by_category(file):
         categories = {}
-        with open(file) as f:
-            reader = csv.reader(f, delimiter=',', quotechar='"')
-            next(reader, None)
-            subjects = []
-            for row in reader:
-                subjects.append(row[4])
-
-            subjects = set(subjects)
-
-            for s in subjects:
-                categories[s] = []
-
         with open(file) as f:
             reader = csv.reader(f, delimiter=',', quotechar='"')
             next(reader, None)
             for r in reader:
-                key = r[4]
-                value = r[1]
-                categories[key].append(value)
-            return categories
+                categories.setdefault(r[4], []).append(r[1])
+        return categories
+
+    @staticmethod
+    def index_sentence_files(data_dir):
+        """Maps each module of ``data_dir`` to its ``-sent.txt`` file, listing the directory only once."""
+        with os.scandir(data_dir) as entries:
+            return {entry.name[:-len('-sent.txt')]: entry.path for entry in entries
+                    if entry.name.endswith('-sent.txt') and entry.is_file()}
 
     @staticmethod
-    def merge_modules_by_subject(dictionary, data_dir, out_dir):
+    def merge_modules_by_subject(dictionary, data_dir, out_dir, force=False):
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        manifest = Manifest(out_dir + MANIFEST_NAME, force)
+        index = DataOrganizer.index_sentence_files(data_dir)
+
         for k in tqdm(dictionary):
-            content = ''
             if len(dictionary[k]) > 2:
-                for module in dictionary[k]:
-                    sentences_file = data_dir + module + '-sent.txt'
-                    if os.path.isfile(sentences_file):
-                        with open(sentences_file, encoding='utf8') as f:
-                            content+= f.read()
-                out_file = k + '.txt'
+                sentences_files = [index[module] for module in dictionary[k] if module in index]
+                out_file = out_dir + k + '.txt'
+                if not manifest.is_stale(sentences_files, [out_file]):
+                    continue
+
+                # Stream every module straight into the output instead of building the whole text in memory
+                with open(out_file, 'wb') as out:
+                    for sentences_file in sentences_files:
+                        with open(sentences_file, 'rb') as f:
+                            shutil.copyfileobj(f, out, COPY_BUFFER_SIZE)
+                manifest.record(sentences_files, [out_file])
+        manifest.save()
 
-                if not os.path.exists(out_dir):
-                    os.makedirs(out_dir)
+    @staticmethod
+    def sample_area(sources, out_file, sample_size=1000, seed=None):
+        """
+        Writes a random sample of the lines of one area.
 
-                with open(out_dir+out_file, 'w', encoding='utf8') as ff:
-                    ff.write(content)
+        Args:
+            sources (list): The area file, or the sentence files of its modules to sample from each in proportion
+                to its number of lines.
+            out_file (str): Path to the sample file.
+            sample_size (int, optional): Number of lines to keep. Areas with fewer lines are kept whole.
+                Defaults to 1000.
+            seed (int, optional): Seed of the random generator. The generator of each area is derived from it and
+                from ``out_file``, so a seeded sample does not depend on the order or process the areas run in.
+        """
+        rng = random.Random(None if seed is None else f'{seed}:{os.path.basename(out_file)}')
+        files = [open(source, encoding='utf8') for source in sources]
+        try:
+            sample = stratified_sample(files, sample_size, rng)
+        finally:
+            for f in files:
+                f.close()
+        with open(out_file, 'w', encoding='utf8') as out:
+            out.writelines(sample)
 
     @staticmethod
-    def get_samples(src_dir):
+    def get_samples(src_dir, sample_size=1000, seed=None, categories=None, data_dir=None, workers=1, chunksize=1):
+        """
+        Samples every area file of a directory into an ``-sample.txt`` file next to it.
+
+        Only ``sample_size`` lines of an area are held in memory.
+
+        Args:
+            src_dir (str): Directory of the area files written by ``merge_modules_by_subject``.
+            sample_size (int, optional): Number of lines per sample. Defaults to 1000.
+            seed (int, optional): Makes the samples reproducible. Defaults to None.
+            categories (dict, optional): Subject -> modules mapping from ``get_modules_by_category``. When given
+                with ``data_dir``, every module of an area contributes to its sample in proportion to its size.
+            data_dir (str, optional): Directory of the modules' ``-sent.txt`` files. Required with ``categories``.
+            workers (int, optional): Number of processes sampling areas in parallel. Defaults to 1.
+            chunksize (int, optional): Number of areas sent to a worker at a time. Defaults to 1.
+        """
+        if categories is not None and data_dir is None:
+            raise ValueError("categories requires data_dir, the directory of the modules' -sent.txt files")
+        index = DataOrganizer.index_sentence_files(data_dir) if categories is not None else None
+        areas = []
         for area in os.listdir(src_dir):
-            with open(src_dir+area, encoding='utf8') as f:
-                lines = f.readlines()
-                random.shuffle(lines)
-                sample = random.sample(lines, 1000)
-                with open(src_dir + area.replace('.txt', '-sample.txt'), 'w', encoding='utf8') as out:
-                    out.writelines(sample)
+            if not area.endswith('.txt') or area.endswith('-sample.txt'):
+                continue
+            sources = [src_dir + area]
+            if index is not None and area[:-len('.txt')] in categories:
+                modules = [index[module] for module in categories[area[:-len('.txt')]] if module in index]
+                if modules:
+                    sources = modules
+                else:
+                    print(f'no module files found for {area}, sampling the area file')
+            areas.append((sources, src_dir + area.replace('.txt', '-sample.txt'), sample_size, seed))
 
+        for (_, out_file, _, _), error in run_parallel(DataOrganizer.sample_area, areas, workers, chunksize,
+                                                             desc='sample'):
+            if error is not None:
+                print('fail: ' + os.path.basename(out_file))
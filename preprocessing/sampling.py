@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+import math
+from itertools import islice
+
+
+def _open_uniform(rng):
+    """Draws from the open interval (0, 1), so that its logarithm is always defined."""
+    u = rng.random()
+    while u == 0.0:
+        u = rng.random()
+    return u
+
+
+def reservoir_sample(items, size, rng):
+    """
+    Draws a uniform sample of ``size`` items from an iterable of unknown length, in a single pass.
+
+    Uses Algorithm L (Li, 1994): instead of drawing a random number for every item, it draws how many items to skip
+    before the next replacement, and skips them without looking at them. Only ``size`` items are ever held in memory.
+
+    Args:
+        items (iterable): Items to sample from, e.g. the lines of an open file.
+        size (int): Number of items to keep.
+        rng (random.Random): Source of randomness.
+
+    Returns:
+        list: ``size`` items in no particular order, or every item when there are fewer.
+    """
+    items = iter(items)
+    reservoir = list(islice(items, size))
+    if len(reservoir) < size or size <= 0:
+        return reservoir
+
+    w = math.exp(math.log(_open_uniform(rng)) / size)
+    while w < 1.0:
+        skip = math.floor(math.log(_open_uniform(rng)) / math.log1p(-w))
+        item = next(islice(items, skip, None), None)
+        if item is None:
+            break
+        reservoir[rng.randrange(size)] = item
+        w *= math.exp(math.log(_open_uniform(rng)) / size)
+    return reservoir
+
+
+def allocate(size, counts):
+    """Splits ``size`` across strata in proportion to ``counts``, handing out the remainders largest first."""
+    total = sum(counts)
+    if total <= size:
+        return list(counts)
+    shares = [size * c / total for c in counts]
+    allocation = [int(share) for share in shares]
+    by_remainder = sorted(range(len(counts)), key=lambda i: allocation[i] - shares[i])
+    for i in by_remainder[:size - sum(allocation)]:
+        allocation[i] += 1
+    return allocation
+
+
+def stratified_sample(strata, size, rng):
+    """
+    Draws ``size`` items across several files, each contributing in proportion to its number of lines.
+
+    A first pass counts the lines of every file and splits ``size`` between them; a second pass draws each file's
+    share with ``reservoir_sample``. Only ``size`` lines are held in memory, whatever the number of files.
+
+    Args:
+        strata (list): Open files (anything iterable with ``seek``), e.g. the sentence files of the modules of an
+            area.
+        size (int): Total number of items to keep.
+        rng (random.Random): Source of randomness.
+
+    Returns:
+        list: The sampled items, shuffled.
+    """
+    if len(strata) == 1:  # Nothing to allocate: a single pass is enough
+        sample = reservoir_sample(strata[0], size, rng)
+        rng.shuffle(sample)
+        return sample
+
+    counts = []
+    for items in strata:
+        counts.append(sum(1 for _ in items))
+        items.seek(0)
+
+    sample = []
+    for items, share in zip(strata, allocate(size, counts)):
+        sample.extend(reservoir_sample(items, share, rng))
+    rng.shuffle(sample)
+    return sample
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+
+"""
+Opt-in profiling of a command: wall-clock time per stage, plus a cProfile of the whole run.
+
+Code marks its stages with ``stage(name)`` (or ``timed_iter`` for lazy inputs); the marks cost nothing until a
+``Profiler`` is activated by ``main.py --profile``. Stages nest: the "read" stage of the "gpt" command is reported as
+"gpt/read". Only the current process is profiled. Work done in worker processes (-w > 1) shows up as time spent
+waiting for them; profile with -w 1 to see inside it. The pipeline stages report their busy time themselves.
+"""
+
+_active = None
+_END = object()
+
+
+class Profiler:
+    """
+    Records the duration of named stages and, when enabled, profiles them with cProfile.
+
+    A disabled profiler does nothing, so stages can be marked unconditionally.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.pid = os.getpid()
+        self.timings = {}
+        self.stack = []
+        self.profile = cProfile.Profile() if enabled else None
+
+    @contextmanager
+    def stage(self, name):
+        """Times the enclosed block as stage ``name``, nested in the current stage."""
+        if not self.enabled:
+            yield
+            return
+        self.stack.append(name)
+        path = '/'.join(self.stack)
+        self.timings.setdefault(path, [0, 0.0])  # Lists a stage before the stages nested in it
+        outermost = len(self.stack) == 1
+        start = time.perf_counter()
+        if outermost:
+            self.profile.enable()
+        try:
+            yield
+        finally:
+            if outermost:
+                self.profile.disable()
+            self.stack.pop()
+            self._add(path, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """Adds ``seconds`` to stage ``name`` of the current stage, e.g. time measured in another process."""
+        if self.enabled:
+            self._add('/'.join(self.stack + [name]), seconds)
+
+    def _add(self, path, seconds):
+        timing = self.timings.setdefault(path, [0, 0.0])
+        timing[0] += 1
+        timing[1] += seconds
+
+    def report(self, path=None, limit=25, out=sys.stderr):
+        """
+        Prints the stage timings and the functions with the highest cumulative time.
+
+        Args:
+            path (str, optional): File the raw profile is saved to, for ``python -m pstats`` or snakeviz.
+            limit (int, optional): Number of functions listed. Defaults to 25.
+            out (file, optional): Stream the report is printed to. Defaults to stderr, to keep stdout clean.
+        """
+        if not self.enabled:
+            return
+        # Shares are relative to the outermost stages; stages of other processes may overlap the main one
+        total = sum(seconds for name, (_, seconds) in self.timings.items() if '/' not in name)
+        print('stage,calls,seconds,share', file=out)
+        for name, (calls, seconds) in self.timings.items():
+            print(f'{name},{calls},{seconds:.3f},{seconds / total if total else 0:.1%}', file=out)
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        print(stream.getvalue(), file=out)
+        if path:
+            stats.dump_stats(path)
+            print(f'Profile saved to {path}', file=out)
+
+
+class Stopwatch:
+    """Accumulates the time spent in its ``with`` blocks, e.g. the busy time of a pipeline stage process."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds += time.perf_counter() - self.start
+
+    def iter(self, iterable):
+        """Yields the items of ``iterable``, timing only the production of each item."""
+        iterator = iter(iterable)
+        while True:
+            with self:
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+
+def activate(profiler):
+    """Makes ``profiler`` the one the ``stage`` marks of this process report to."""
+    global _active
+    _active = profiler
+
+
+def _current():
+    """The active profiler, unless it is disabled or belongs to a parent process (forked workers inherit it)."""
+    if _active is None or not _active.enabled or _active.pid != os.getpid():
+        return None
+    return _active
+
+
+def stage(name):
+    """Times the enclosed block as stage ``name`` of the active profiler, if any."""
+    profiler = _current()
+    return nullcontext() if profiler is None else profiler.stage(name)
+
+
+def record(name, seconds):
+    """Adds ``seconds`` measured elsewhere to stage ``name`` of the active profiler, if any."""
+    profiler = _current()
+    if profiler is not None:
+        profiler.record(name, seconds)
+
+
+def timed_iter(name, iterable):
+    """Times the production of every item of a lazy ``iterable`` as stage ``name``; unchanged when not profiling."""
+    return iterable if _current() is None else _timed_iter(name, iterable)
+
+
+def _timed_iter(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            item = next(iterator, _END)
+        if item is _END:
+            return
+        yield item
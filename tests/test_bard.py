@@ -0,0 +1,85 @@
+import re
+import threading
+import time
+import pytest
+import classification.bard
+from classification.bard import BardBiasClassifier, BardError
+
+
+class StubBard:
+    """Stands in for ``bardapi.Bard``, answering every numbered sentence after scripted error answers."""
+
+    errors = 0  # Number of "Response Error" answers sent before the real ones
+    omit = None  # Sentence left out of every answer holding more than one sentence
+    delay = None  # Seconds to wait before answering, from the sentences of the prompt
+    prompts = []
+    sessions = []
+    lock = threading.Lock()
+
+    def __init__(self, token=None, session=None):
+        StubBard.sessions.append(session)
+
+    def get_answer(self, prompt):
+        sentences = re.findall(r"^\s*(\d+)\. (.*)$", prompt.split("Sentences:")[-1], re.M)
+        with StubBard.lock:
+            StubBard.prompts.append([sentence for _, sentence in sentences])
+            if StubBard.errors:
+                StubBard.errors -= 1
+                return {"content": "Response Error: b'' \nUnable to get response."}
+        if StubBard.delay is not None:
+            time.sleep(StubBard.delay([sentence for _, sentence in sentences]))
+        rows = [f"| {i} | {'YES' if 'his' in sentence.lower() else 'NO'} | {sentence} |" for i, sentence in sentences
+                if sentence != StubBard.omit or len(sentences) == 1]
+        return {"content": "| Index | Label | Explanation |\n|---|---|---|\n" + "\n".join(rows)}
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+    monkeypatch.setattr(classification.bard, "backoff_delay", lambda attempt: 0)
+    monkeypatch.setattr(StubBard, "errors", 0)
+    monkeypatch.setattr(StubBard, "omit", None)
+    monkeypatch.setattr(StubBard, "delay", None)
+    monkeypatch.setattr(StubBard, "prompts", [])
+    monkeypatch.setattr(StubBard, "sessions", [])
+    return BardBiasClassifier("token", max_retries=2, backend=StubBard)
+
+
+def test_error_answers_are_retried(classifier):
+    StubBard.errors = 2
+    results = classifier.classify_sentences(["Her work.", "His work."])
+    assert [(r["sentence_index"], r["bias"]) for r in results] == [(1, "NO"), (2, "YES")]
+    assert len(StubBard.prompts) == 3
+
+
+def test_too_many_error_answers_are_raised(classifier):
+    StubBard.errors = 3
+    with pytest.raises(BardError, match="Response Error"):
+        classifier.classify_sentences(["Her work."])
+    assert len(StubBard.prompts) == 3
+
+
+def test_missing_sentence_is_sent_again(classifier):
+    StubBard.omit = "Sentence 2."
+    results = classifier.classify_sentences([f"Sentence {i}." for i in range(1, 4)])
+    assert [(r["sentence_index"], r["explanation"]) for r in results] == [(i, f"Sentence {i}.") for i in range(1, 4)]
+    assert StubBard.prompts[1:] == [["Sentence 2."]]
+
+
+def test_concurrent_batches_share_the_session_and_keep_their_order(classifier):
+    batches = [[f"Batch {b} sentence {i}." for i in range(1, 4)] for b in range(12)]
+    StubBard.errors = 3  # Failures spread over several threads are retried too
+    # Earlier batches answer later, so the requests complete out of order
+    StubBard.delay = lambda sentences: 0.05 / (1 + int(re.search(r"\d+", sentences[0]).group()))
+    results = classifier.classify_batches(batches, max_concurrency=4)
+    assert [[r["explanation"] for r in batch] for batch in results] == batches
+    assert len(StubBard.prompts) == 15
+    assert len(StubBard.sessions) > 1 and set(map(id, StubBard.sessions)) == {id(classifier.session)}
+
+
+def test_failed_batch_is_returned_in_its_place(classifier, monkeypatch):
+    monkeypatch.setattr(classifier, "max_retries", 0)
+    StubBard.errors = 1
+    results = classifier.classify_batches([["Her work."], ["His work."]], max_concurrency=1,
+                                          return_exceptions=True)
+    assert isinstance(results[0], BardError)
+    assert [r["bias"] for r in results[1]] == ["YES"]
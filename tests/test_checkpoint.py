@@ -0,0 +1,65 @@
+import json
+import os
+import pytest
+from classification.checkpoint import Checkpoint
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "job.jsonl"), str(tmp_path / "sentences.csv")
+
+
+def test_resume_reads_completed_batches(paths):
+    path, file_path = paths
+    job = Checkpoint(path, file_path, 50)
+    job.record(0, 2, [{"row": 0, "bias": "NO"}, {"row": 1, "bias": "YES"}])
+    job.record(2, 1, [{"row": 2, "bias": "NO"}])
+    job.close()
+
+    job = Checkpoint(path, file_path, 50)
+    assert job.has(0, 2) and job.has(2, 1)
+    assert job.results(2) == [{"row": 2, "bias": "NO"}]
+    job.record(3, 1, [])
+    job.close()
+    with open(path) as f:
+        assert len(f.readlines()) == 4  # The header is not written again
+
+
+def test_batch_of_another_size_is_not_replayed(paths):
+    path, file_path = paths
+    job = Checkpoint(path, file_path, 50, token_budget=3000)
+    job.record(0, 20, [])
+    assert not job.has(0, 25)
+    assert not job.has(20, 20)
+    job.close()
+
+
+def test_line_cut_by_a_crash_is_truncated(paths):
+    path, file_path = paths
+    job = Checkpoint(path, file_path, 50)
+    job.record(0, 1, [{"row": 0, "bias": "NO"}])
+    job.close()
+    with open(path, "a") as f:
+        f.write('{"offset": 1, "size": 1, "res')
+    size = os.path.getsize(path)
+
+    job = Checkpoint(path, file_path, 50)
+    assert job.has(0, 1) and not job.has(1, 1)
+    assert os.path.getsize(path) < size
+    job.record(1, 1, [{"row": 1, "bias": "YES"}])
+    job.close()
+    with open(path) as f:
+        entries = [json.loads(line) for line in f]  # Every line is valid JSON again
+    assert [entry.get("offset") for entry in entries] == [None, 0, 1]
+
+
+@pytest.mark.parametrize("batch_size, token_budget, other", [(50, None, False), (40, None, False),
+                                                              (50, 3000, False), (50, None, True)])
+def test_header_of_another_job_is_rejected(paths, tmp_path, batch_size, token_budget, other):
+    path, file_path = paths
+    Checkpoint(path, file_path, 50).close()
+    if (batch_size, token_budget, other) == (50, None, False):
+        Checkpoint(path, file_path, batch_size, token_budget).close()
+        return
+    with pytest.raises(ValueError, match="belongs to another job"):
+        Checkpoint(path, str(tmp_path / "other.csv") if other else file_path, batch_size, token_budget)
@@ -0,0 +1,32 @@
+import numpy as np
+from preprocessing.dedup import Deduplicator
+
+
+def test_exact_duplicates_after_normalization():
+    dedup = Deduplicator()
+    assert dedup.add("The  cat sat.") == (0, True)
+    assert dedup.add("The cat sat. ") == (0, False)
+    assert dedup.add("The café sat.") == (1, True)
+    assert dedup.add("The café sat.") == (1, False)
+
+
+def test_near_duplicate_found_in_a_bucket_shared_with_an_earlier_sentence():
+    dedup = Deduplicator(near_duplicates=True)
+    first = np.zeros(64, dtype=np.uint64)
+    second = np.ones(64, dtype=np.uint64)
+    second[:8] = 0  # Shares the first band with the first sentence, nothing else
+    third = second.copy()
+    third[8::8] = 2  # Shares only the first band with the second sentence too, but 57 of its 64 minimums
+    signatures = {"first": first, "second": second, "third": third}
+    dedup.signature = signatures.get
+    assert dedup.add("first") == (0, True)
+    assert dedup.add("second") == (1, True)
+    assert dedup.add("third") == (1, False)
+
+
+def test_near_duplicates_of_real_sentences():
+    dedup = Deduplicator(near_duplicates=True)
+    assert dedup.add("Every engineer should check his work twice before the release.")[1]
+    assert dedup.add("Every engineer should check her work twice before the release.") == (0, False)
+    assert dedup.add("The weather was pleasant during the whole conference week.")[1]
+    assert dedup.exact == 0 and dedup.near == 1
@@ -0,0 +1,93 @@
+import random
+import re
+import pytest
+from classification.gender import GenderBiasChecker, LexiconMatcher
+
+
+def reference_check_bias(checker, text):
+    """The nested ``stem in word`` loops ``LexiconMatcher`` replaced."""
+    female_count = 0
+    male_count = 0
+    for word in re.findall(r'\b\w+\b', text.lower()):
+        for masc in checker.masculine_words:
+            if masc in word:
+                male_count += 1
+        for fem in checker.feminine_words:
+            if fem in word:
+                female_count += 1
+    bias_score = male_count - female_count
+    if bias_score == 0:
+        bias_classification = 'neutral'
+    elif bias_score < -3:
+        bias_classification = "strongly feminine-coded"
+    elif bias_score < 0:
+        bias_classification = "feminine-coded"
+    elif bias_score > 3:
+        bias_classification = "strongly masculine-coded"
+    else:
+        bias_classification = "masculine-coded"
+    return male_count, female_count, bias_classification
+
+
+# Stems that contain or overlap others: "interpersonal" holds "interpersona", "selfconfident" holds "confident",
+# "decisive" holds "decision"'s prefix, "leadership" holds "lead" and "sharing" holds "sharin"...
+OVERLAPPING = ["interpersonal", "selfconfident", "self-confident", "decisiveness", "leadership", "sharing",
+               "dominantly", "interdependent", "cooperative", "co-operation", "kindness", "understanding",
+               "unreasonable", "headstrong", "nagging", "responsive", "competitive", "analytical", "agreeable"]
+FILLERS = ["the", "course", "students", "will", "data", "é", "Ü", "42", "_", "x", "a-b", "self", "inter", "co"]
+SEPARATORS = [" ", " ", " ", "-", ", ", ". ", "\t", "'", "_", ""]
+
+
+def random_word(rng, stems):
+    kind = rng.random()
+    if kind < 0.3:
+        return rng.choice(stems)
+    if kind < 0.5:
+        return rng.choice(OVERLAPPING)
+    if kind < 0.7:  # Two stems glued together, possibly overlapping
+        first, second = rng.choice(stems), rng.choice(stems)
+        return first + second[rng.randrange(len(second)):]
+    if kind < 0.8:  # A cut stem, which must not match
+        stem = rng.choice(stems)
+        return stem[:rng.randrange(1, len(stem))]
+    if kind < 0.9:
+        return "".join(rng.choice("abcdefghijklmnopqrstuvwxyzé-_") for _ in range(rng.randint(1, 12)))
+    return rng.choice(FILLERS)
+
+
+def random_line(rng, stems):
+    words = [random_word(rng, stems) for _ in range(rng.randint(0, 15))]
+    if rng.random() < 0.3:
+        words = [word.upper() if rng.random() < 0.5 else word.capitalize() for word in words]
+    return "".join(word + rng.choice(SEPARATORS) for word in words)
+
+
+@pytest.fixture(scope="module")
+def checker():
+    return GenderBiasChecker()
+
+
+@pytest.fixture(scope="module")
+def lines(checker):
+    rng = random.Random(20240501)
+    stems = checker.masculine_words + checker.feminine_words
+    lines = [random_line(rng, stems) for _ in range(3000)]
+    return lines + rng.sample(lines, 500)  # Repeated lines go through the deduplicated path of count_many
+
+
+def test_check_bias_matches_nested_loops(checker, lines):
+    for line in lines:
+        assert checker.check_bias(line) == reference_check_bias(checker, line), line
+
+
+def test_check_bias_many_matches_nested_loops(checker, lines):
+    male, female, labels = checker.check_bias_many(lines)
+    expected = [reference_check_bias(checker, line) for line in lines]
+    assert list(zip(male.tolist(), female.tolist(), labels.tolist())) == expected
+
+
+def test_every_overlapping_stem_counts():
+    matcher = LexiconMatcher(["lead", "leader", "ship", "adershi"], ["lea", "ea"])
+    assert matcher.count("leadership") == (4, 2)
+    assert matcher.count("leadleader") == (2, 2)
+    assert matcher.count("led") == (0, 0)
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pandas as pd
+import pytest
+from openai import BadRequestError
+import classification.gpt
+from classification.gpt import GPTBiasClassifier
+
+
+class MockOpenAI:
+    """Local chat completions endpoint answering every numbered sentence, after failing with scripted statuses."""
+
+    def __init__(self, statuses=(), omit=None, delay=None):
+        self.statuses = list(statuses)  # Status codes of the first requests, e.g. [429, 500]
+        self.omit = omit  # Sentence left out of every answer holding more than one sentence
+        self.delay = delay  # Seconds to wait before answering, from the sentences of the request
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def answer(self, body):
+        prompt = body["messages"][0]["content"]
+        sentences = re.findall(r"^\s*(\d+)\. (.*)$", prompt.split("Sentences:")[-1], re.M)
+        with self.lock:
+            self.prompts.append([sentence for _, sentence in sentences])
+            status = self.statuses.pop(0) if self.statuses else 200
+        if status != 200:
+            return status, {"error": {"message": f"mock error {status}", "type": "mock", "code": None}}
+        if self.delay is not None:
+            time.sleep(self.delay([sentence for _, sentence in sentences]))
+        rows = [f"{i} | {'YES' if 'his' in sentence.lower() else 'NO'} | {sentence}" for i, sentence in sentences
+                if sentence != self.omit or len(sentences) == 1]
+        content = "Index | Label | Explanation\n--- | --- | ---\n" + "\n".join(rows)
+        return 200, {"id": "mock", "object": "chat.completion", "created": 0, "model": body["model"],
+                     "choices": [{"index": 0, "finish_reason": "stop",
+                                  "message": {"role": "assistant", "content": content}}]}
+
+    def start(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                status, body = mock.answer(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    monkeypatch.setattr(classification.gpt, "backoff_delay", lambda attempt: 0.01)
+    mocks = []
+
+    def start(**kwargs):
+        mocks.append(MockOpenAI(**kwargs))
+        return mocks[-1], GPTBiasClassifier(api_key="test", base_url=mocks[-1].start())
+
+    yield start
+    for mock in mocks:
+        mock.server.shutdown()
+        mock.server.server_close()
+
+
+def test_rate_limits_and_server_errors_are_retried(serve):
+    mock, classifier = serve(statuses=[429, 500, 503])
+    results = asyncio.run(classifier.classify_batches_async([["Her work.", "His work."]], max_concurrency=1))
+    assert [(r["sentence_index"], r["bias"]) for r in results[0]] == [(1, "NO"), (2, "YES")]
+    assert len(mock.prompts) == 4
+
+
+def test_too_many_failures_are_raised(serve):
+    mock, classifier = serve(statuses=[500] * 3)
+    with pytest.raises(Exception, match="mock error 500"):
+        asyncio.run(classifier.classify_batches_async([["Her work."]], max_retries=2))
+    assert len(mock.prompts) == 3
+
+
+def test_client_error_is_not_retried(serve):
+    mock, classifier = serve(statuses=[400])
+    results = asyncio.run(classifier.classify_batches_async([["Her work."], ["His work."]], max_concurrency=1,
+                                                            return_exceptions=True))
+    assert isinstance(results[0], BadRequestError)
+    assert [r["bias"] for r in results[1]] == ["YES"]
+    assert len(mock.prompts) == 2
+
+
+def test_missing_sentence_is_sent_again(serve):
+    mock, classifier = serve(omit="Sentence 3.")
+    results = classifier.classify_sentences([f"Sentence {i}." for i in range(1, 5)])
+    assert [(r["sentence_index"], r["explanation"]) for r in results] == [(i, f"Sentence {i}.") for i in range(1, 5)]
+    assert mock.prompts[1:] == [["Sentence 3."]]
+
+
+def test_concurrent_results_are_in_input_order(serve, tmp_path):
+    sentences = [f"Sentence {i} about his work." if i % 3 else f"Sentence {i}." for i in range(40)]
+    file_path = tmp_path / "sentences.csv"
+    pd.DataFrame({"sentences": sentences}).to_csv(file_path, index=False)
+    # Earlier batches answer later, so the requests complete in reverse order
+    mock, classifier = serve(delay=lambda batch: 0.05 / (1 + int(re.search(r"\d+", batch[0]).group())))
+    results = list(classifier.iter_classify_from_csv_async(str(file_path), batch_size=4, max_concurrency=4,
+                                                           window=5))
+    assert [r["row"] for r in results] == list(range(40))
+    assert [r["explanation"] for r in results] == sentences
+    assert len(mock.prompts) == 10
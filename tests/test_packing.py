@@ -0,0 +1,83 @@
+from classification.packing import BatchPacker, parse_table, retry_missing
+
+
+def answer(sentences, skip=(), index=lambda i: i):
+    """Answers every sentence but those in ``skip``, with indices mapped by ``index``."""
+    return [{"sentence_index": index(i), "bias": "NO", "explanation": sentence}
+            for i, sentence in enumerate(sentences, 1) if sentence not in skip]
+
+
+def test_complete_answer_is_sent_once():
+    calls = []
+    results = retry_missing(lambda batch: calls.append(batch) or answer(batch), ["a", "b", "c"])
+    assert calls == [["a", "b", "c"]]
+    assert [(r["sentence_index"], r["explanation"]) for r in results] == [(1, "a"), (2, "b"), (3, "c")]
+
+
+def test_missing_sentences_are_sent_again_in_halves():
+    calls = []
+
+    def query(batch):
+        calls.append(batch)
+        return answer(batch, skip=("b", "c", "e", "f") if len(calls) == 1 else ())
+
+    sentences = ["a", "b", "c", "d", "e", "f"]
+    results = retry_missing(query, sentences)
+    assert calls == [sentences, ["b", "c"], ["e", "f"]]
+    assert [(r["sentence_index"], r["explanation"]) for r in results] == list(enumerate(sentences, 1))
+
+
+def test_last_sentence_left_out_is_sent_alone():
+    calls = []
+
+    def query(batch):
+        calls.append(batch)
+        return answer(batch, skip=(batch[-1],) if len(batch) > 1 else ())
+
+    results = retry_missing(query, ["a", "b", "c", "d"])
+    assert calls == [["a", "b", "c", "d"], ["d"]]
+    assert [r["sentence_index"] for r in results] == [1, 2, 3, 4]
+
+
+def test_mis_indexed_answer_is_dropped_and_split():
+    calls = []
+
+    def query(batch):
+        calls.append(batch)
+        # The first answer is numbered from 0, so its rows cannot be trusted
+        return answer(batch, index=(lambda i: i - 1) if len(calls) == 1 else (lambda i: i))
+
+    results = retry_missing(query, ["a", "b", "c", "d"])
+    assert calls == [["a", "b", "c", "d"], ["a", "b"], ["c", "d"]]
+    assert [(r["sentence_index"], r["explanation"]) for r in results] == list(enumerate("abcd", 1))
+
+
+def test_duplicate_index_is_dropped():
+    calls = []
+
+    def query(batch):
+        calls.append(batch)
+        return answer(batch, index=(lambda i: 1) if len(calls) == 1 else (lambda i: i))
+
+    assert len(retry_missing(query, ["a", "b"])) == 2
+    assert calls == [["a", "b"], ["a"], ["b"]]
+
+
+def test_sentence_never_answered_is_left_out():
+    results = retry_missing(lambda batch: answer(batch, skip=("c",)), ["a", "b", "c", "d"])
+    assert [(r["sentence_index"], r["explanation"]) for r in results] == [(1, "a"), (2, "b"), (4, "d")]
+
+
+def test_parse_table_formats():
+    content = ("Here are the results:\n| Index | Label | Explanation |\n|---|---|---|\n| 1 | NO | Neutral. |\n"
+               "**2** | YES | Gendered. \n3. | NO | Fine | really\nAll done.")
+    assert parse_table(content) == [{"sentence_index": 1, "bias": "NO", "explanation": "Neutral."},
+                                    {"sentence_index": 2, "bias": "YES", "explanation": "Gendered."},
+                                    {"sentence_index": 3, "bias": "NO", "explanation": "Fine | really"}]
+
+
+def test_packer_respects_budget_and_batch_size():
+    packer = BatchPacker(prompt_tokens=10, token_budget=100, max_response_tokens=1000, response_tokens=10,
+                         max_batch_size=3)
+    batches = packer.pack(["word " * 4] * 7 + ["word " * 400])
+    assert [len(batch) for batch in batches] == [3, 3, 1, 1]
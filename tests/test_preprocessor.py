@@ -0,0 +1,50 @@
+import random
+import re
+from preprocessing.preprocessor import TextPreprocessor
+
+
+def reference_clean_sentence(text):
+    """The per-character implementation ``clean_sentence`` replaced."""
+    out_text = ''
+    text = re.sub(r"http\S+", "", text)
+    text = re.sub(r'\S*@\S*\s?', 'EMAIL', text)
+    text = text.replace('_', ' ').replace('  ', ' ')
+    for x in text:
+        if re.match(r'[\?\!,\.:\';]', x):
+            xx = ' ' + x + ' '
+        elif re.match('[a-zA-Z1-9 ]', x):
+            xx = x
+        else:
+            continue
+        out_text += xx
+    out = out_text.lower()
+    return re.sub('  ', ' ', out)
+
+
+# Letters, 0 (dropped, unlike 1-9), the spaced punctuation, whitespace that is kept or dropped, and non-ASCII
+ALPHABET = "aZq019 ?!,.:';_-\"()\t\n\r\x0béÉßü€😀  "
+FRAGMENTS = ["http://example.org/a?b=1", "https", "user@mail.com", "@", "a@b", "e.g.", "Dr. ", "  ", "   ", "__",
+             " _ ", "...", "?!", "EMAIL", "I'm", "x_y", "(see p. 2)"]
+
+
+def random_text(rng):
+    parts = []
+    for _ in range(rng.randint(0, 12)):
+        if rng.random() < 0.3:
+            parts.append(rng.choice(FRAGMENTS))
+        else:
+            parts.append("".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 10))))
+    return "".join(parts)
+
+
+def test_clean_sentence_matches_per_character_loop():
+    rng = random.Random(20240510)
+    for _ in range(20000):
+        text = random_text(rng)
+        assert TextPreprocessor.clean_sentence(text) == reference_clean_sentence(text), repr(text)
+
+
+def test_clean_many_matches_clean_sentence():
+    rng = random.Random(7)
+    texts = [random_text(rng) for _ in range(1000)]
+    assert TextPreprocessor.clean_many(texts) == [reference_clean_sentence(text) for text in texts]